@@ -1,32 +1,43 @@
 from flask import Flask, render_template, request, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 import json
-from predictDetector import processImages
+from predictDetector import (getPool, getClientes, despacharImagem, coletarImagens, cancelarImagens,
+                             assinaturaModelo, resultadoErro, BASE_DIR, UPLOAD_FOLDER)
+from processamentoVideo import processVideo, MODOS_AMOSTRAGEM
+from modelPool import PoolSaturadoError
+from ingestaoUpload import lerUpload, CampoRecebido, UploadInvalido, MAX_LOTE
+import historico
 
-# Definir caminhos relativos à localização do arquivo app.py
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Definir caminhos relativos à raiz do projeto (UPLOAD_FOLDER é o mesmo em que
+# o predictDetector salva as imagens de resultado)
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 
 # Inicializar o Flask com os caminhos corretos para templates e arquivos estáticos
 app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
 
 # Configurações
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'webp'}
-MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# O corpo é lido em streaming, então o limite do lote pode ser bem maior que o de
+# um arquivo (MAX_ARQUIVO / MAX_VIDEO, conferidos durante a leitura em ingestaoUpload.py)
+app.config['MAX_CONTENT_LENGTH'] = MAX_LOTE
 
 # Criar pasta de uploads se não existir
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 print(f"📁 Pasta de uploads: {UPLOAD_FOLDER}")
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def respostaSaturado(erro):
+    """Resposta rápida quando o pool de modelos não admite mais trabalho"""
+    # Fila cheia: o cliente está pedindo demais (429); timeout: servidor sobrecarregado (503)
+    status = 429 if erro.motivo == 'fila_cheia' else 503
+    resposta = jsonify({'error': str(erro), 'motivo': erro.motivo, 'retry_after': erro.retry_after})
+    resposta.headers['Retry-After'] = str(erro.retry_after)
+    return resposta, status
 
 @app.route('/')
 def index():
@@ -40,40 +51,183 @@ def resultado():
 
 @app.route('/upload', methods=['POST'])
 def upload_files():
-    """Endpoint para processar múltiplas imagens"""
+    """
+    Endpoint para processar múltiplas imagens e vídeos.
+
+    O corpo multipart é lido em streaming (ingestaoUpload.py): cada imagem
+    válida começa a ser processada assim que termina de chegar. Por isso os
+    campos resumo_ia e modo_video precisam vir antes dos arquivos.
+    """
+    pool = getPool()
+    indice_modelo = None    # Vaga do pool reservada para o lote inteiro
+    despachadas = []        # (caminho, future) das imagens em processamento
+    arquivos = []           # Na ordem de envio, inclusive os recusados
+    concluido = False       # Só uma requisição concluída mantém os arquivos recebidos
     try:
-        # Verificar se arquivos foram enviados
-        if 'files[]' not in request.files:
-            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return jsonify({'error': 'Envie os arquivos como multipart/form-data'}), 400
+        
+        resumo_ia = False
+        modo_video = 'cena'
+        assinatura = assinaturaModelo()
+        
+        por_hash = {}           # sha256 -> resultado (None enquanto a imagem está em processamento)
+        hashes_despachados = []
         
-        files = request.files.getlist('files[]')
+        for parte in lerUpload(request.stream, boundary, app.config['UPLOAD_FOLDER'],
+                               ALLOWED_EXTENSIONS, ALLOWED_VIDEO_EXTENSIONS):
+            if isinstance(parte, CampoRecebido):
+                if arquivos:
+                    return jsonify({'error': 'Envie resumo_ia e modo_video antes dos arquivos'}), 400
+                if parte.nome == 'resumo_ia':
+                    # O resumo do Gemini pode ser pedido explicitamente
+                    resumo_ia = parte.valor.lower() in ('1', 'true', 'on')
+                elif parte.nome == 'modo_video':
+                    if parte.valor not in MODOS_AMOSTRAGEM:
+                        return jsonify({'error': "Parâmetro 'modo_video' deve ser 'cena' ou 'fixo'"}), 400
+                    modo_video = parte.valor
+                continue
+            
+            arquivos.append(parte)
+            if parte.erro:
+                print(f"⚠️ Arquivo recusado: {parte.nome} - {parte.erro}")
+                continue
+            
+            # Controle de admissão uma vez por requisição, só quando o primeiro arquivo
+            # válido termina de chegar: clientes lentos não seguram vaga enquanto enviam
+            # o começo do corpo, e as imagens do lote não disputam vagas entre si
+            if indice_modelo is None:
+                indice_modelo = pool.reservar()
+            
+            # Imagens repetidas (no lote ou já vistas pelo mesmo modelo) não são processadas de novo
+            if parte.tipo == 'imagem' and parte.sha256 not in por_hash:
+                por_hash[parte.sha256] = resultadoEmCache(parte.sha256, assinatura, resumo_ia)
+                if por_hash[parte.sha256] is None:
+                    despachadas.append((parte.caminho, despacharImagem(parte.caminho, resumo_ia=resumo_ia,
+                                                                        indice_modelo=indice_modelo)))
+                    hashes_despachados.append(parte.sha256)
         
-        if not files or files[0].filename == '':
-            return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+        if not arquivos:
+            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        
+        if all(a.erro for a in arquivos):
+            return jsonify({
+                'error': 'Nenhum arquivo válido encontrado',
+                'detalhes': [{'arquivo': a.nome, 'erro': a.erro} for a in arquivos]
+            }), 400
         
-        # Salvar arquivos válidos
-        saved_files = []
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                saved_files.append(filepath)
+        # Espera as imagens que ainda estão em processamento
+        por_hash.update(zip(hashes_despachados, coletarImagens(despachadas)))
         
-        if not saved_files:
-            return jsonify({'error': 'Nenhum arquivo válido encontrado'}), 400
+        resultados = []
+        videos = {}
+        for arquivo in arquivos:
+            if arquivo.erro:
+                # Nunca o nome bruto enviado pelo cliente: ele é gravado no histórico e exibido na página
+                resultado = resultadoErro(arquivo.nome, arquivo.erro)
+            elif arquivo.tipo == 'video':
+                # Vídeos: quadros-chave + rastreamento, um resultado (e um resumo) por vídeo
+                if arquivo.sha256 not in videos:
+                    videos[arquivo.sha256] = processVideo(arquivo.caminho, resumo_ia=resumo_ia,
+                                                           modo=modo_video, indice_modelo=indice_modelo)
+                resultado = videos[arquivo.sha256]
+            else:
+                resultado = dict(por_hash[arquivo.sha256], assinatura_modelo=assinatura)
+            
+            if not arquivo.erro:
+                # Cada envio aparece com o próprio nome (sanitizado), mesmo quando o resultado
+                # foi reaproveitado; `arquivo` é o nome em disco, usado para servir a mídia
+                resultado = dict(resultado, imagem_original=arquivo.nome,
+                                 arquivo=os.path.basename(arquivo.caminho), sha256=arquivo.sha256)
+            resultados.append(resultado)
         
-        # Processar imagens
-        resultados = processImages(saved_files)
+        # Guardar no histórico; a página de resultados busca pelo lote
+        lote_id = historico.salvarLote(resultados)
+        concluido = True
         
         return jsonify({
             'success': True,
-            'total_imagens': len(saved_files),
+            'lote_id': lote_id,
+            'total_imagens': len([a for a in arquivos if not a.erro]),
             'resultados': resultados
         })
     
+    except PoolSaturadoError as e:
+        return respostaSaturado(e)
+    except UploadInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'Lote maior que {MAX_LOTE // (1024 * 1024)} MB'}), 413
     except Exception as e:
         return jsonify({'error': f'Erro ao processar: {str(e)}'}), 500
+    finally:
+        if not concluido:
+            # Requisição recusada ou abortada no meio: para as imagens despachadas (esperando
+            # as threads terminarem) e só então apaga os arquivos que já tinham chegado, que
+            # não teriam nenhuma linha do histórico apontando para eles
+            cancelarImagens(despachadas)
+            for arquivo in arquivos:
+                arquivo.remover()
+        if indice_modelo is not None:
+            pool.liberar(indice_modelo)
+
+def resultadoEmCache(sha256, assinatura, resumo_ia):
+    """Resultado de uma imagem idêntica já processada, se a imagem de resultado ainda existir"""
+    resultado = historico.buscarPorHash(sha256, assinatura, origem_analise='gemini' if resumo_ia else None)
+    if resultado and os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], resultado['imagem_resultado'])):
+        print(f"♻️ Resultado reaproveitado do histórico ({sha256[:12]})")
+        return resultado
+    return None
+
+@app.route('/api/pool')
+def pool_status():
+    """Métricas do pool de modelos (tamanho, fila, espera, recusas)"""
+    return jsonify(getPool().estatisticas())
+
+@app.route('/api/clientes')
+def clientes_status():
+    """Métricas dos clientes assíncronos (chamadas, retries e falhas por serviço)"""
+    return jsonify(getClientes().estatisticas())
+
+@app.route('/api/resultados')
+def listar_resultados():
+    """Histórico paginado: ?lote_id=&classe=&desde=&ate=&limite=&cursor="""
+    try:
+        return jsonify(historico.listarResultados(
+            limite=request.args.get('limite', historico.LIMITE_PADRAO, type=int),
+            cursor=request.args.get('cursor', type=int),
+            lote_id=request.args.get('lote_id', type=int),
+            classe=request.args.get('classe'),
+            desde=request.args.get('desde'),
+            ate=request.args.get('ate')
+        ))
+    except Exception as e:
+        return jsonify({'error': f'Erro ao consultar histórico: {str(e)}'}), 500
+
+@app.route('/api/resultados/contagens')
+def contagens_resultados():
+    """Contagem de detecções por classe, agrupada por dia (?agrupar=dia) ou por lote (?agrupar=lote)"""
+    agrupar = request.args.get('agrupar', 'dia')
+    try:
+        if agrupar == 'dia':
+            contagens = historico.contagemPorDia(
+                desde=request.args.get('desde'),
+                ate=request.args.get('ate'),
+                classe=request.args.get('classe')
+            )
+        elif agrupar == 'lote':
+            contagens = historico.contagemPorLote(
+                lote_id=request.args.get('lote_id', type=int),
+                classe=request.args.get('classe'),
+                limite=request.args.get('limite', historico.LIMITE_PADRAO, type=int)
+            )
+        else:
+            return jsonify({'error': "Parâmetro 'agrupar' deve ser 'dia' ou 'lote'"}), 400
+        
+        return jsonify({'agrupar': agrupar, 'contagens': contagens})
+    except Exception as e:
+        return jsonify({'error': f'Erro ao consultar histórico: {str(e)}'}), 500
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
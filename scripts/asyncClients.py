@@ -0,0 +1,316 @@
+import asyncio
+import base64
+import os
+import random
+import threading
+import time
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+"""
+CAMADA DE CLIENTES ASSÍNCRONOS (DETECTOR E GEMINI)
+
+As chamadas remotas (detector hospedado no Roboflow e Gemini) rodam num
+event loop dedicado, em background, com uma sessão HTTP persistente por
+serviço. Assim as conexões são reaproveitadas entre imagens e entre
+requisições, e um lote de imagens é enviado em paralelo.
+
+Cada serviço tem:
+- Limite de chamadas simultâneas (semáforo)
+- Limitador de taxa por token bucket, ajustado à cota do provedor
+- Retry com backoff exponencial e jitter para erros transitórios
+
+As URLs base são configuráveis (ROBOFLOW_API_URL, GEMINI_API_URL), o que
+permite apontar os clientes para servidores stub locais nos testes.
+"""
+
+# Status HTTP considerados transitórios (vale a pena tentar de novo)
+STATUS_TRANSITORIOS = {408, 425, 429, 500, 502, 503, 504}
+
+PROMPT_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompt.md')
+
+
+class ErroTransitorio(Exception):
+    """Falha que pode ser resolvida tentando novamente (timeout, 429, 5xx)"""
+
+    def __init__(self, mensagem, retry_after=None):
+        self.retry_after = retry_after
+        super().__init__(mensagem)
+
+
+class TokenBucket:
+    """
+    Limitador de taxa por token bucket (para uso dentro do event loop).
+
+    Args:
+        taxa (float): Tokens repostos por segundo (ex.: 60 RPM -> 1.0)
+        capacidade (int): Rajada máxima permitida
+    """
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = float(capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    async def adquirir(self):
+        """Espera até haver um token disponível e o consome"""
+        # O lock garante ordem de chegada: quem entrou primeiro sai primeiro
+        async with self._lock:
+            self._repor()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.taxa)
+                self._repor()
+            self._tokens -= 1
+
+
+class ClienteServico:
+    """
+    Base dos clientes: concorrência limitada, rate limit e retry com jitter.
+
+    Args:
+        nome (str): Nome do serviço (usado nos logs e nas métricas)
+        concorrencia (int): Chamadas simultâneas permitidas
+        rpm (float): Cota de requisições por minuto do provedor
+        rajada (int): Capacidade do token bucket
+        tentativas (int): Número máximo de tentativas por chamada
+        backoff_base (float): Espera base do backoff, em segundos
+        backoff_max (float): Espera máxima entre tentativas, em segundos
+        timeout (float): Timeout total de cada tentativa, em segundos
+    """
+
+    def __init__(self, nome, concorrencia=8, rpm=600, rajada=10, tentativas=4,
+                 backoff_base=0.5, backoff_max=8.0, timeout=60.0):
+        self.nome = nome
+        self.concorrencia = concorrencia
+        self.tentativas = tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._rpm = rpm
+        self._rajada = rajada
+        self._sessao = None
+        self._semaforo = None
+        self._bucket = None
+
+        # Métricas
+        self.chamadas = 0
+        self.retries = 0
+        self.falhas = 0
+
+    async def abrir(self):
+        """Cria a sessão HTTP persistente (deve rodar dentro do event loop)"""
+        self._semaforo = asyncio.Semaphore(self.concorrencia)
+        self._bucket = TokenBucket(self._rpm / 60.0, self._rajada)
+        conector = aiohttp.TCPConnector(limit=self.concorrencia, keepalive_timeout=60)
+        self._sessao = aiohttp.ClientSession(connector=conector, timeout=self.timeout)
+
+    async def fechar(self):
+        if self._sessao is not None:
+            await self._sessao.close()
+            self._sessao = None
+
+    def _espera(self, tentativa, retry_after=None):
+        """Backoff exponencial com 'full jitter', respeitando o Retry-After do servidor"""
+        teto = min(self.backoff_max, self.backoff_base * (2 ** tentativa))
+        espera = random.uniform(0, teto)
+        if retry_after is not None:
+            espera = max(espera, min(retry_after, self.backoff_max))
+        return espera
+
+    async def _requisitar(self, metodo, url, **kwargs):
+        """
+        Faz a requisição HTTP e retorna o JSON da resposta.
+
+        Erros transitórios (rede, timeout, 429, 5xx) são tentados novamente;
+        os demais (ex.: 400, 401) falham imediatamente.
+        """
+        ultima_falha = None
+        for tentativa in range(self.tentativas):
+            if tentativa > 0:
+                self.retries += 1
+                retry_after = getattr(ultima_falha, 'retry_after', None)
+                await asyncio.sleep(self._espera(tentativa - 1, retry_after))
+
+            await self._bucket.adquirir()
+            async with self._semaforo:
+                self.chamadas += 1
+                try:
+                    async with self._sessao.request(metodo, url, **kwargs) as resposta:
+                        if resposta.status in STATUS_TRANSITORIOS:
+                            retry_after = resposta.headers.get('Retry-After')
+                            raise ErroTransitorio(
+                                f"{self.nome}: HTTP {resposta.status}",
+                                float(retry_after) if retry_after and retry_after.isdigit() else None
+                            )
+                        if resposta.status >= 400:
+                            corpo = await resposta.text()
+                            self.falhas += 1
+                            raise RuntimeError(f"{self.nome}: HTTP {resposta.status} - {corpo[:200]}")
+                        return await resposta.json(content_type=None)
+                except ErroTransitorio as e:
+                    ultima_falha = e
+                except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                    ultima_falha = ErroTransitorio(f"{self.nome}: {type(e).__name__} {e}")
+
+            print(f"⚠️ {ultima_falha} (tentativa {tentativa + 1}/{self.tentativas})")
+
+        self.falhas += 1
+        raise ultima_falha
+
+    def estatisticas(self):
+        return {
+            'concorrencia': self.concorrencia,
+            'rpm': self._rpm,
+            'chamadas': self.chamadas,
+            'retries': self.retries,
+            'falhas': self.falhas,
+        }
+
+
+class ClienteDetector(ClienteServico):
+    """
+    Cliente da API hospedada de detecção do Roboflow.
+
+    Equivale ao `model.predict(...).json()` do SDK, mas recebe os bytes da
+    imagem já codificada em vez de um caminho de arquivo.
+    """
+
+    def __init__(self, api_key, projeto, versao, base_url="https://detect.roboflow.com", **kwargs):
+        super().__init__('detector', **kwargs)
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/{projeto}/{versao}"
+
+    async def predict(self, imagem_bytes, confidence=40, overlap=30):
+        if not self.api_key:
+            raise ValueError("Chave de API do Roboflow (API_KEY_ROBOFLOW) não encontrada no arquivo .env")
+
+        params = {
+            'api_key': self.api_key,
+            'confidence': confidence,
+            'overlap': overlap,
+            'format': 'json',
+        }
+        return await self._requisitar(
+            'POST', self.url,
+            params=params,
+            data=base64.b64encode(imagem_bytes).decode('ascii'),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'}
+        )
+
+
+class ClienteGemini(ClienteServico):
+    """Cliente da API REST do Gemini (generateContent) com o prompt.md como system instruction"""
+
+    def __init__(self, api_key, modelo="gemini-2.0-flash-exp",
+                 base_url="https://generativelanguage.googleapis.com", prompt_file=PROMPT_PADRAO, **kwargs):
+        super().__init__('gemini', **kwargs)
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{modelo}:generateContent"
+        self.system_instruction = None
+        if prompt_file and os.path.exists(prompt_file):
+            with open(prompt_file, 'r', encoding='utf-8') as f:
+                self.system_instruction = f.read()
+
+    async def gerar(self, texto):
+        """Envia o relatório ao Gemini e retorna o texto da resposta (ou None em caso de erro)"""
+        if not self.api_key:
+            print("Erro com a chave de API")
+            return None
+
+        corpo = {
+            'contents': [{
+                'role': 'user',
+                'parts': [{'text': f"Analise o seguinte relatório:\n\n{texto}"}]
+            }]
+        }
+        if self.system_instruction:
+            corpo['system_instruction'] = {'parts': [{'text': self.system_instruction}]}
+
+        try:
+            dados = await self._requisitar(
+                'POST', self.url,
+                json=corpo,
+                headers={'x-goog-api-key': self.api_key}
+            )
+            partes = dados['candidates'][0]['content']['parts']
+            return ''.join(p.get('text', '') for p in partes)
+        except Exception as e:
+            print(f"Erro ao processar: {e}")
+            return None
+
+
+class ClientesAsync:
+    """
+    Event loop dedicado (thread em background) com os clientes persistentes.
+
+    O Flask atende cada requisição numa thread síncrona; `executar` agenda a
+    corrotina neste loop e bloqueia até o resultado, sem recriar sessões.
+    """
+
+    def __init__(self, detector, gemini):
+        self.detector = detector
+        self.gemini = gemini
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='clientes-async', daemon=True)
+        self._thread.start()
+        self.executar(self._abrir())
+
+    async def _abrir(self):
+        await self.detector.abrir()
+        await self.gemini.abrir()
+
+    async def _fechar(self):
+        await self.detector.fechar()
+        await self.gemini.fechar()
+
+    def executar(self, corrotina, timeout=None):
+        """Executa a corrotina no loop dos clientes e retorna o resultado"""
+        return asyncio.run_coroutine_threadsafe(corrotina, self.loop).result(timeout)
+
+    def fechar(self):
+        self.executar(self._fechar())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def estatisticas(self):
+        return {
+            'detector': self.detector.estatisticas(),
+            'gemini': self.gemini.estatisticas(),
+        }
+
+    @classmethod
+    def doAmbiente(cls):
+        """Cria os clientes a partir das variáveis de ambiente (.env)"""
+        # Quem respeita a cota é o token bucket (DETECTOR_RPM/DETECTOR_BURST), não o
+        # semáforo: a concorrência padrão acompanha a rajada para que uma rajada inteira
+        # saia de uma vez. 600 RPM (10 req/s) com ~2 s de latência no pior caso também
+        # dá 20 chamadas em voo (taxa x latência); abaixo disso a concorrência, e não a
+        # cota, passa a limitar o lote
+        rajada_detector = int(os.getenv("DETECTOR_BURST", 20))
+        detector = ClienteDetector(
+            api_key=os.getenv("API_KEY_ROBOFLOW"),
+            projeto=os.getenv("ROBOFLOW_PROJECT", "constructionaps-twwga"),
+            versao=int(os.getenv("ROBOFLOW_VERSION", 1)),
+            base_url=os.getenv("ROBOFLOW_API_URL", "https://detect.roboflow.com"),
+            concorrencia=int(os.getenv("DETECTOR_CONCURRENCY", rajada_detector)),
+            rpm=float(os.getenv("DETECTOR_RPM", 600)),
+            rajada=rajada_detector,
+        )
+        gemini = ClienteGemini(
+            api_key=os.getenv("API_KEY"),
+            modelo=os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp"),
+            base_url=os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com"),
+            concorrencia=int(os.getenv("GEMINI_CONCURRENCY", 4)),
+            rpm=float(os.getenv("GEMINI_RPM", 60)),
+            rajada=int(os.getenv("GEMINI_BURST", 5)),
+        )
+        return cls(detector, gemini)
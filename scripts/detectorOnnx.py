@@ -0,0 +1,125 @@
+import ast
+import time
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+"""
+DETECTOR LOCAL (YOLOv8 EXPORTADO PARA ONNX)
+
+Roda o modelo exportado por exportModel.py na CPU com o ONNX Runtime e
+devolve as predições no mesmo formato da API do Roboflow (centro x/y,
+width/height, confidence, class), para que o restante do pipeline
+(extrairDeteccoes, drawDetections, regras) funcione sem mudanças.
+"""
+
+
+def prepararEntrada(imagem, largura, altura):
+    """Converte uma imagem BGR no tensor de entrada do YOLOv8: (1, 3, altura, largura), RGB, float32 em [0, 1]"""
+    # Mesmo redimensionamento simples (sem letterbox) usado no treino e no preprocess_image
+    entrada = cv2.resize(imagem, (largura, altura), interpolation=cv2.INTER_LINEAR)
+    entrada = cv2.cvtColor(entrada, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)[np.newaxis]
+    return np.ascontiguousarray(entrada, dtype=np.float32) / 255.0
+
+
+class PredicaoOnnx:
+    """Resultado de DetectorOnnx.predict, com `.json()` igual ao do SDK do Roboflow"""
+
+    def __init__(self, dados):
+        self.dados = dados
+
+    def json(self):
+        return self.dados
+
+
+class DetectorOnnx:
+    """
+    Detector YOLOv8 em ONNX para CPU.
+
+    Args:
+        caminho (str): Arquivo .onnx (FP32 ou INT8)
+        threads (int): Threads intra-op do ONNX Runtime (None = padrão do runtime)
+    """
+
+    def __init__(self, caminho, threads=None):
+        opcoes = ort.SessionOptions()
+        if threads:
+            opcoes.intra_op_num_threads = threads
+            opcoes.inter_op_num_threads = 1
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.caminho = caminho
+        self.sessao = ort.InferenceSession(caminho, sess_options=opcoes, providers=['CPUExecutionProvider'])
+        entrada = self.sessao.get_inputs()[0]
+        self.nome_entrada = entrada.name
+        self.altura, self.largura = entrada.shape[2], entrada.shape[3]
+
+        # O Ultralytics grava os nomes das classes nos metadados do ONNX
+        metadados = self.sessao.get_modelmeta().custom_metadata_map
+        nomes = ast.literal_eval(metadados['names']) if 'names' in metadados else {}
+        self.classes = [nomes[i] for i in sorted(nomes)] if nomes else []
+
+    def carregar(self, imagem):
+        """Aceita caminho de arquivo, bytes codificados (JPEG/PNG) ou array BGR do OpenCV"""
+        if isinstance(imagem, str):
+            imagem = cv2.imread(imagem)
+        elif isinstance(imagem, (bytes, bytearray)):
+            imagem = cv2.imdecode(np.frombuffer(imagem, np.uint8), cv2.IMREAD_COLOR)
+        if imagem is None:
+            raise ValueError("Não foi possível carregar a imagem para o detector ONNX")
+        return imagem
+
+    def inferir(self, imagem, confianca_min=0.25, iou_nms=0.45):
+        """
+        Executa o modelo e aplica o NMS por classe.
+
+        Returns:
+            tuple: (caixas xyxy em pixels da imagem, scores, ids de classe) - arrays numpy
+        """
+        imagem = self.carregar(imagem)
+        altura_img, largura_img = imagem.shape[:2]
+
+        entrada = prepararEntrada(imagem, self.largura, self.altura)
+
+        # Saída do YOLOv8: (1, 4 + n_classes, n_ancoras) -> (n_ancoras, 4 + n_classes)
+        saida = self.sessao.run(None, {self.nome_entrada: entrada})[0][0].T
+        scores_classes = saida[:, 4:]
+        ids = scores_classes.argmax(axis=1)
+        scores = scores_classes[np.arange(len(ids)), ids]
+
+        mascara = scores >= confianca_min
+        caixas_cxcywh, scores, ids = saida[mascara, :4], scores[mascara], ids[mascara]
+        if len(scores) == 0:
+            return np.zeros((0, 4), np.float32), scores, ids
+
+        escala = np.array([largura_img / self.largura, altura_img / self.altura] * 2, dtype=np.float32)
+        caixas = np.empty_like(caixas_cxcywh)
+        caixas[:, :2] = caixas_cxcywh[:, :2] - caixas_cxcywh[:, 2:] / 2
+        caixas[:, 2:] = caixas_cxcywh[:, :2] + caixas_cxcywh[:, 2:] / 2
+        caixas *= escala
+
+        # NMS por classe: desloca as caixas de cada classe para não se sobreporem entre classes
+        deslocadas = caixas + (ids[:, None] * 4096.0)
+        xywh = np.concatenate([deslocadas[:, :2], deslocadas[:, 2:] - deslocadas[:, :2]], axis=1)
+        manter = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), confianca_min, iou_nms)
+        manter = np.array(manter, dtype=np.int64).reshape(-1)
+        return caixas[manter], scores[manter], ids[manter]
+
+    def predict(self, imagem, confidence=40, overlap=30):
+        """Mesma assinatura do model.predict do Roboflow (confidence e overlap em 0-100)"""
+        inicio = time.perf_counter()
+        caixas, scores, ids = self.inferir(imagem, confidence / 100.0, overlap / 100.0)
+        tempo = time.perf_counter() - inicio
+
+        predictions = []
+        for (x1, y1, x2, y2), score, classe in zip(caixas.tolist(), scores.tolist(), ids.tolist()):
+            predictions.append({
+                'x': (x1 + x2) / 2,
+                'y': (y1 + y2) / 2,
+                'width': x2 - x1,
+                'height': y2 - y1,
+                'confidence': score,
+                'class': self.classes[classe] if classe < len(self.classes) else str(classe),
+                'class_id': classe
+            })
+        return PredicaoOnnx({'time': tempo, 'predictions': predictions})
@@ -0,0 +1,499 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import time
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from detectorOnnx import DetectorOnnx, prepararEntrada
+
+"""
+EXPORTAÇÃO, QUANTIZAÇÃO E BENCHMARK DO MODELO EM CPU
+
+1. Exporta os pesos treinados no trainModelYOLO.ipynb (best.pt) para ONNX FP32
+2. Gera uma variante INT8 (quantização estática), calibrada com imagens da
+   pasta de saída do preProcessingImages.py
+3. Mede latência (p50/p95), throughput e pico de RAM de cada variante em CPU,
+   para cada número de threads, cada medição num processo separado
+4. Calcula mAP@0.5, mAP@0.5:0.95 e precisão/revocação no limiar de
+   confiança da aplicação (CONFIDENCE_THRESHOLD) num split separado
+5. Recomenda a variante mais rápida cuja precisão fique dentro da tolerância
+   em relação ao FP32, pronta para usar via MODELO_ONNX / ONNX_THREADS
+   (só com --teste: sem medir a precisão não há recomendação)
+
+As imagens do split de teste passam pelo preprocess_image antes da inferência,
+como na aplicação; as da calibração já são a saída do preProcessingImages.py.
+
+Uso:
+    python scripts/exportModel.py --pesos modelos_salvos/best.pt \\
+        --calibracao dados/processed --teste dados/test
+"""
+
+EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Parâmetros da avaliação de mAP (mesmos padrões do `yolo val`)
+CONFIANCA_MAP = 0.001
+IOU_NMS_MAP = 0.7
+LIMIARES_IOU = np.linspace(0.5, 0.95, 10)
+
+
+def listarImagens(pasta, limite=None):
+    """Imagens de uma pasta, em ordem alfabética"""
+    imagens = sorted(
+        caminho for caminho in glob.glob(os.path.join(pasta, '*'))
+        if caminho.lower().endswith(EXTENSOES_IMAGEM)
+    )
+    return imagens[:limite] if limite else imagens
+
+
+# ====================================
+# EXPORTAÇÃO E QUANTIZAÇÃO
+# ====================================
+
+def exportarFp32(pesos, destino, imgsz=640):
+    """Exporta os pesos do Ultralytics para ONNX FP32 (entrada fixa 1x3ximgszximgsz)"""
+    from ultralytics import YOLO
+
+    print(f"📦 Exportando {pesos} para ONNX...")
+    exportado = YOLO(pesos).export(format='onnx', imgsz=imgsz, dynamic=False, simplify=False)
+    shutil.move(exportado, destino)
+    print(f"✅ Modelo FP32: {destino}")
+    return destino
+
+
+class CalibradorImagens(CalibrationDataReader):
+    """Alimenta a calibração INT8 com o mesmo pré-processamento usado na inferência"""
+
+    def __init__(self, imagens, nome_entrada, largura, altura):
+        self.imagens = iter(imagens)
+        self.nome_entrada = nome_entrada
+        self.largura = largura
+        self.altura = altura
+
+    def get_next(self):
+        for caminho in self.imagens:
+            imagem = cv2.imread(caminho)
+            if imagem is not None:
+                return {self.nome_entrada: prepararEntrada(imagem, self.largura, self.altura)}
+        return None
+
+
+def nosCabecaDeteccao(modelo):
+    """
+    Nós da cabeça Detect do YOLOv8 (DFL, sigmoid e o concat final).
+
+    A saída junta coordenadas em pixels (0-640) com scores (0-1) no mesmo
+    tensor; quantizá-la numa escala só praticamente zera os scores, então a
+    cabeça fica em FP32 e apenas o backbone/neck vira INT8.
+    """
+    prefixos = {no.name.split('/dfl/')[0] for no in modelo.graph.node if '/dfl/' in no.name}
+    return [no.name for no in modelo.graph.node if any(no.name.startswith(p + '/') for p in prefixos)]
+
+
+def quantizarInt8(fp32, destino, imagens_calibracao, quantizar_cabeca=False):
+    """Quantização estática INT8 (QDQ, pesos por canal) calibrada com imagens reais"""
+    if not imagens_calibracao:
+        raise ValueError("Nenhuma imagem de calibração encontrada")
+
+    preparado = destino.replace('.onnx', '_pre.onnx')
+    quant_pre_process(fp32, preparado)
+
+    modelo = onnx.load(preparado)
+    entrada = modelo.graph.input[0]
+    dims = [d.dim_value for d in entrada.type.tensor_type.shape.dim]
+    altura, largura = dims[2], dims[3]
+    excluir = [] if quantizar_cabeca else nosCabecaDeteccao(modelo)
+
+    print(f"⚙️ Calibrando INT8 com {len(imagens_calibracao)} imagens "
+          f"({len(excluir)} nós da cabeça mantidos em FP32)...")
+    quantize_static(
+        preparado, destino,
+        CalibradorImagens(imagens_calibracao, entrada.name, largura, altura),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluir
+    )
+    os.remove(preparado)
+    print(f"✅ Modelo INT8: {destino}")
+    return destino
+
+
+# ====================================
+# BENCHMARK DE CPU
+# ====================================
+
+def memoriaPicoMb():
+    """Pico de memória residente do processo atual, em MB"""
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa em KB, macOS em bytes
+        return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+
+
+def carregarQuadros(imagens, preprocessar):
+    """
+    Lê as imagens do benchmark e, se vierem cruas (split de teste), aplica o
+    mesmo preprocess_image da aplicação.
+    """
+    if preprocessar:
+        # Importado só aqui: o albumentations não precisa ir para os processos do benchmark
+        from preProcessingImages import preprocess_image
+    quadros = []
+    for caminho in imagens:
+        imagem = cv2.imread(caminho)
+        if imagem is not None:
+            quadros.append(preprocess_image(imagem) if preprocessar else imagem)
+    if not quadros:
+        raise ValueError("Nenhuma imagem válida para o benchmark")
+    return quadros
+
+
+def _medirVariante(caminho, threads, quadros, aquecimento, repeticoes, confianca, overlap, fila):
+    """Executado num processo filho, para que o pico de RAM seja só desta variante"""
+    try:
+        detector = DetectorOnnx(caminho, threads=threads)
+
+        for i in range(aquecimento):
+            detector.inferir(quadros[i % len(quadros)], confianca, overlap)
+
+        latencias = []
+        inicio_total = time.perf_counter()
+        for i in range(repeticoes):
+            inicio = time.perf_counter()
+            detector.inferir(quadros[i % len(quadros)], confianca, overlap)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        total = time.perf_counter() - inicio_total
+
+        fila.put({
+            'latencia_media_ms': round(float(np.mean(latencias)), 2),
+            'latencia_p50_ms': round(float(np.percentile(latencias, 50)), 2),
+            'latencia_p95_ms': round(float(np.percentile(latencias, 95)), 2),
+            'throughput_img_s': round(repeticoes / total, 2),
+            'ram_pico_mb': round(memoriaPicoMb(), 1)
+        })
+    except Exception as e:
+        fila.put({'erro': str(e)})
+
+
+def medirVariante(caminho, threads, quadros, aquecimento=5, repeticoes=50, confianca=0.6, overlap=0.3,
+                  timeout=600):
+    """
+    Mede uma variante com um número de threads, isolada num processo novo.
+
+    Se o processo morrer sem responder (ex.: falta de memória) ou passar de
+    `timeout` segundos, a medição falha em vez de travar o script.
+    """
+    contexto = multiprocessing.get_context('spawn')
+    fila = contexto.Queue()
+    processo = contexto.Process(
+        target=_medirVariante,
+        args=(caminho, threads, quadros, aquecimento, repeticoes, confianca, overlap, fila)
+    )
+    processo.start()
+    prazo = time.monotonic() + timeout
+    resultado = None
+    try:
+        while resultado is None:
+            try:
+                resultado = fila.get(timeout=1)
+            except queue.Empty:
+                if not processo.is_alive() and fila.empty():
+                    raise RuntimeError(f"Benchmark de {caminho} com {threads} threads: "
+                                       f"processo encerrado sem resultado (exitcode {processo.exitcode})")
+                if time.monotonic() > prazo:
+                    raise RuntimeError(f"Benchmark de {caminho} com {threads} threads passou de {timeout}s")
+    finally:
+        processo.join(5)
+        if processo.is_alive():
+            processo.terminate()
+            processo.join()
+    if 'erro' in resultado:
+        raise RuntimeError(f"Benchmark de {caminho} com {threads} threads falhou: {resultado['erro']}")
+    return resultado
+
+
+# ====================================
+# AVALIAÇÃO (mAP)
+# ====================================
+
+def carregarRotulos(caminho_rotulo, largura, altura):
+    """Lê um rótulo YOLO (classe cx cy w h normalizados) e devolve (ids, caixas xyxy em pixels)"""
+    if not os.path.exists(caminho_rotulo):
+        return np.zeros(0, np.int64), np.zeros((0, 4), np.float32)
+
+    with open(caminho_rotulo) as f:
+        linhas = [l.split() for l in f if l.strip()]
+    # Rótulos de segmentação (polígonos) viram a caixa que os envolve
+    ids, caixas = [], []
+    for partes in linhas:
+        valores = np.array(partes[1:], dtype=np.float32)
+        if len(valores) == 4:
+            cx, cy, w, h = valores
+            x1, y1, x2, y2 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+        else:
+            xs, ys = valores[0::2], valores[1::2]
+            x1, y1, x2, y2 = xs.min(), ys.min(), xs.max(), ys.max()
+        ids.append(int(partes[0]))
+        caixas.append([x1 * largura, y1 * altura, x2 * largura, y2 * altura])
+    return np.array(ids, np.int64), np.array(caixas, np.float32).reshape(-1, 4)
+
+
+def iouMatriz(a, b):
+    """IoU entre cada caixa de `a` (N, 4) e de `b` (M, 4), formato xyxy"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersecao = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersecao / (area_a[:, None] + area_b[None, :] - intersecao + 1e-9)
+
+
+def casarDeteccoes(caixas, scores, ids, caixas_gt, ids_gt):
+    """
+    Marca cada predição como verdadeiro positivo em cada limiar de IoU
+    (casamento guloso por score, uma predição por objeto, mesma classe).
+
+    Returns:
+        np.ndarray: (n_predicoes, len(LIMIARES_IOU)) booleano
+    """
+    acertos = np.zeros((len(scores), len(LIMIARES_IOU)), dtype=bool)
+    if len(scores) == 0 or len(ids_gt) == 0:
+        return acertos
+
+    ious = iouMatriz(caixas, caixas_gt)
+    ious[ids[:, None] != ids_gt[None, :]] = 0
+    ordem = np.argsort(-scores)
+    for j, limiar in enumerate(LIMIARES_IOU):
+        usados = np.zeros(len(ids_gt), dtype=bool)
+        for i in ordem:
+            candidatos = np.where(~usados & (ious[i] >= limiar))[0]
+            if len(candidatos):
+                melhor = candidatos[ious[i, candidatos].argmax()]
+                usados[melhor] = True
+                acertos[i, j] = True
+    return acertos
+
+
+def calcularAp(revocacao, precisao):
+    """Área sob a curva precisão x revocação (interpolação de 101 pontos, mesma conta do `yolo val`)"""
+    mrec = np.concatenate(([0.0], revocacao, [1.0]))
+    mpre = np.concatenate(([1.0], precisao, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    x = np.linspace(0, 1, 101)
+    return float(np.trapezoid(np.interp(x, mrec, mpre), x))
+
+
+def avaliarModelo(caminho, pasta_teste, confianca_operacao=0.6, threads=None):
+    """
+    Avalia uma variante num split no formato YOLO (pasta_teste/images + pasta_teste/labels).
+
+    Returns:
+        dict: mAP@0.5, mAP@0.5:0.95 e precisão/revocação/F1 na confiança de operação
+    """
+    from preProcessingImages import preprocess_image
+
+    detector = DetectorOnnx(caminho, threads=threads)
+    pasta_imagens = os.path.join(pasta_teste, 'images')
+    pasta_rotulos = os.path.join(pasta_teste, 'labels')
+
+    todas_acertos, todos_scores, todos_ids, ids_gt_total = [], [], [], []
+    for caminho_imagem in listarImagens(pasta_imagens):
+        imagem = cv2.imread(caminho_imagem)
+        if imagem is None:
+            continue
+        # Mesmo pré-processamento da aplicação; os rótulos são normalizados, então
+        # basta convertê-los com as dimensões da imagem processada
+        imagem = preprocess_image(imagem)
+        altura, largura = imagem.shape[:2]
+        base = os.path.splitext(os.path.basename(caminho_imagem))[0]
+        ids_gt, caixas_gt = carregarRotulos(os.path.join(pasta_rotulos, f"{base}.txt"), largura, altura)
+
+        caixas, scores, ids = detector.inferir(imagem, CONFIANCA_MAP, IOU_NMS_MAP)
+        todas_acertos.append(casarDeteccoes(caixas, scores, ids, caixas_gt, ids_gt))
+        todos_scores.append(scores)
+        todos_ids.append(ids)
+        ids_gt_total.append(ids_gt)
+
+    if not ids_gt_total:
+        raise ValueError(f"Nenhuma imagem encontrada em {pasta_imagens}")
+
+    acertos = np.concatenate(todas_acertos) if todas_acertos else np.zeros((0, len(LIMIARES_IOU)), bool)
+    scores = np.concatenate(todos_scores)
+    ids = np.concatenate(todos_ids)
+    ids_gt = np.concatenate(ids_gt_total)
+
+    # AP por classe (apenas classes presentes no split)
+    aps = []
+    for classe in np.unique(ids_gt):
+        n_gt = int((ids_gt == classe).sum())
+        mascara = ids == classe
+        if not mascara.any():
+            aps.append([0.0] * len(LIMIARES_IOU))
+            continue
+        ordem = np.argsort(-scores[mascara])
+        acertos_classe = acertos[mascara][ordem]
+        tp = np.cumsum(acertos_classe, axis=0)
+        fp = np.cumsum(~acertos_classe, axis=0)
+        revocacao = tp / n_gt
+        precisao = tp / np.maximum(tp + fp, 1)
+        aps.append([calcularAp(revocacao[:, j], precisao[:, j]) for j in range(len(LIMIARES_IOU))])
+    aps = np.array(aps).reshape(-1, len(LIMIARES_IOU))
+
+    # Ponto de operação da aplicação: IoU 0.5 e confiança >= CONFIDENCE_THRESHOLD
+    no_limiar = scores >= confianca_operacao
+    tp_limiar = int(acertos[no_limiar, 0].sum())
+    precisao = tp_limiar / max(int(no_limiar.sum()), 1)
+    revocacao = tp_limiar / max(len(ids_gt), 1)
+    f1 = 2 * precisao * revocacao / max(precisao + revocacao, 1e-9)
+
+    return {
+        'map50': round(float(aps[:, 0].mean()) if len(aps) else 0.0, 4),
+        'map50_95': round(float(aps.mean()) if len(aps) else 0.0, 4),
+        'precisao': round(precisao, 4),
+        'revocacao': round(revocacao, 4),
+        'f1': round(f1, 4)
+    }
+
+
+# ====================================
+# ESCOLHA DA VARIANTE
+# ====================================
+
+def escolherVariante(relatorio, tolerancia):
+    """
+    Variante + threads com menor latência p50 entre as que não perdem mais que
+    `tolerancia` de mAP@0.5 nem de F1 em relação ao FP32.
+    """
+    referencia = relatorio['variantes']['fp32'].get('precisao_modelo')
+    candidatas = []
+    for nome, variante in relatorio['variantes'].items():
+        metricas = variante.get('precisao_modelo')
+        if referencia and metricas:
+            if metricas['map50'] < referencia['map50'] - tolerancia:
+                continue
+            if metricas['f1'] < referencia['f1'] - tolerancia:
+                continue
+        for threads, medicao in variante['benchmark'].items():
+            candidatas.append((medicao['latencia_p50_ms'], nome, int(threads)))
+
+    if not candidatas:
+        return None
+    _, nome, threads = min(candidatas)
+    return {'variante': nome, 'caminho': relatorio['variantes'][nome]['caminho'], 'threads': threads}
+
+
+def imprimirTabela(relatorio):
+    print("\n" + "=" * 90)
+    print(f"{'variante':<8} {'threads':>7} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} "
+          f"{'RAM MB':>8} {'mAP50':>7} {'mAP50-95':>9} {'F1':>6}")
+    print("-" * 90)
+    for nome, variante in relatorio['variantes'].items():
+        metricas = variante.get('precisao_modelo') or {}
+        for threads, m in variante['benchmark'].items():
+            print(f"{nome:<8} {threads:>7} {m['latencia_p50_ms']:>8} {m['latencia_p95_ms']:>8} "
+                  f"{m['throughput_img_s']:>8} {m['ram_pico_mb']:>8} {metricas.get('map50', '-'):>7} "
+                  f"{metricas.get('map50_95', '-'):>9} {metricas.get('f1', '-'):>6}")
+    print("=" * 90)
+
+
+def main():
+    # Importado só aqui: os processos do benchmark reimportam este módulo e o
+    # predictDetector (Roboflow, Gemini) inflaria o pico de RAM medido
+    from predictDetector import CONFIDENCE_THRESHOLD, OVERLAP_THRESHOLD
+
+    parser = argparse.ArgumentParser(description="Exporta o YOLOv8 para ONNX FP32/INT8 e compara as variantes em CPU")
+    origem = parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument('--pesos', help="Pesos treinados do Ultralytics (ex.: modelos_salvos/best.pt)")
+    origem.add_argument('--onnx', help="ONNX FP32 já exportado (pula a exportação)")
+    parser.add_argument('--saida', default='modelos_salvos/onnx', help="Pasta dos modelos e do relatório")
+    parser.add_argument('--calibracao', required=True, help="Pasta de saída do preProcessingImages.py")
+    parser.add_argument('--n-calibracao', type=int, default=100, help="Máximo de imagens de calibração")
+    parser.add_argument('--teste', help="Split separado no formato YOLO (images/ e labels/) para o mAP")
+    parser.add_argument('--threads', default='1,2,4', help="Números de threads a medir, separados por vírgula")
+    parser.add_argument('--repeticoes', type=int, default=50)
+    parser.add_argument('--aquecimento', type=int, default=5)
+    parser.add_argument('--timeout-benchmark', type=float, default=600,
+                        help="Tempo máximo, em segundos, de cada medição")
+    parser.add_argument('--tolerancia', type=float, default=0.01,
+                        help="Perda máxima de mAP@0.5 e F1 aceita em relação ao FP32")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--quantizar-cabeca', action='store_true',
+                        help="Quantiza também a cabeça Detect (normalmente derruba os scores)")
+    args = parser.parse_args()
+
+    os.makedirs(args.saida, exist_ok=True)
+    fp32 = os.path.join(args.saida, 'modelo_fp32.onnx')
+    int8 = os.path.join(args.saida, 'modelo_int8.onnx')
+
+    if args.pesos:
+        exportarFp32(args.pesos, fp32, args.imgsz)
+    else:
+        shutil.copyfile(args.onnx, fp32)
+
+    imagens_calibracao = listarImagens(args.calibracao, args.n_calibracao)
+    quantizarInt8(fp32, int8, imagens_calibracao, args.quantizar_cabeca)
+
+    # O split de teste tem imagens cruas; a pasta de calibração já está pré-processada
+    pasta_benchmark = os.path.join(args.teste, 'images') if args.teste else args.calibracao
+    quadros_benchmark = carregarQuadros(listarImagens(pasta_benchmark, 20), preprocessar=bool(args.teste))
+    lista_threads = [int(t) for t in args.threads.split(',') if t.strip()]
+
+    relatorio = {'confidence_threshold': CONFIDENCE_THRESHOLD, 'tolerancia': args.tolerancia, 'variantes': {}}
+    for nome, caminho in (('fp32', fp32), ('int8', int8)):
+        variante = {
+            'caminho': caminho,
+            'tamanho_mb': round(os.path.getsize(caminho) / (1024 * 1024), 2),
+            'benchmark': {}
+        }
+        for threads in lista_threads:
+            print(f"⏱️ Medindo {nome} com {threads} thread(s)...")
+            variante['benchmark'][str(threads)] = medirVariante(
+                caminho, threads, quadros_benchmark, args.aquecimento, args.repeticoes,
+                CONFIDENCE_THRESHOLD / 100, OVERLAP_THRESHOLD / 100, args.timeout_benchmark
+            )
+        if args.teste:
+            print(f"🎯 Avaliando {nome} em {args.teste}...")
+            variante['precisao_modelo'] = avaliarModelo(caminho, args.teste, CONFIDENCE_THRESHOLD / 100)
+        relatorio['variantes'][nome] = variante
+
+    imprimirTabela(relatorio)
+
+    # Sem medir a precisão não dá para saber se o INT8 perdeu detecções
+    if args.teste:
+        escolha = escolherVariante(relatorio, args.tolerancia)
+    else:
+        escolha = None
+        print("⚠️ Sem --teste a precisão não foi medida: nenhuma variante é recomendada")
+    relatorio['recomendacao'] = escolha
+
+    caminho_relatorio = os.path.join(args.saida, 'relatorio.json')
+    with open(caminho_relatorio, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    print(f"📝 Relatório: {caminho_relatorio}")
+
+    if escolha:
+        print(f"\n✅ Recomendado: {escolha['variante']} com {escolha['threads']} thread(s)")
+        print(f"   MODELO_ONNX={os.path.abspath(escolha['caminho'])}")
+        print(f"   ONNX_THREADS={escolha['threads']}")
+
+
+if __name__ == "__main__":
+    main()
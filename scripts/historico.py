@@ -0,0 +1,405 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+"""
+HISTÓRICO PERSISTENTE DE DETECÇÕES (SQLite)
+
+Cada resultado do /upload (imagem ou vídeo) é gravado numa base SQLite embutida,
+agrupado pelo lote de upload. As consultas foram pensadas para continuar
+rápidas com milhões de detecções:
+
+- Paginação por cursor (keyset) sobre o id, em vez de OFFSET
+- Índices por classe, por data e por lote
+- Contagens por dia e por lote mantidas em tabelas de agregado,
+  atualizadas na mesma transação da inserção
+- Hash (sha256) de cada arquivo, para reaproveitar o resultado de uma
+  imagem idêntica já processada pelo mesmo modelo
+"""
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.getenv("HISTORICO_DB", os.path.join(BASE_DIR, 'historico.db'))
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lotes (
+    id INTEGER PRIMARY KEY,
+    criado_em TEXT NOT NULL,
+    total_imagens INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS resultados (
+    id INTEGER PRIMARY KEY,
+    lote_id INTEGER NOT NULL REFERENCES lotes(id),
+    criado_em TEXT NOT NULL,
+    imagem_original TEXT NOT NULL,
+    imagem_resultado TEXT,
+    sucesso INTEGER NOT NULL,
+    erro TEXT,
+    mensagem_ia TEXT,
+    dados_json TEXT,
+    origem_analise TEXT,
+    relatorio_bruto TEXT,
+    total_objetos INTEGER NOT NULL DEFAULT 0,
+    tempo_ms REAL,
+    tipo TEXT NOT NULL DEFAULT 'imagem',
+    metricas_video TEXT,
+    sha256 TEXT,
+    assinatura_modelo TEXT,
+    arquivo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_resultados_lote ON resultados(lote_id, id);
+CREATE INDEX IF NOT EXISTS idx_resultados_criado_em ON resultados(criado_em);
+
+CREATE TABLE IF NOT EXISTS deteccoes (
+    id INTEGER PRIMARY KEY,
+    resultado_id INTEGER NOT NULL REFERENCES resultados(id),
+    lote_id INTEGER NOT NULL,
+    criado_em TEXT NOT NULL,
+    classe TEXT NOT NULL,
+    confianca REAL NOT NULL,
+    x REAL, y REAL, width REAL, height REAL
+);
+CREATE INDEX IF NOT EXISTS idx_deteccoes_classe ON deteccoes(classe, resultado_id);
+CREATE INDEX IF NOT EXISTS idx_deteccoes_criado_em ON deteccoes(criado_em);
+CREATE INDEX IF NOT EXISTS idx_deteccoes_lote ON deteccoes(lote_id, classe);
+CREATE INDEX IF NOT EXISTS idx_deteccoes_resultado_classe ON deteccoes(resultado_id, classe);
+
+-- Agregados: evitam varrer a tabela de detecções nas contagens
+CREATE TABLE IF NOT EXISTS contagem_diaria (
+    dia TEXT NOT NULL,
+    classe TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (dia, classe)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS contagem_lote (
+    lote_id INTEGER NOT NULL,
+    classe TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (lote_id, classe)
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_criado = set()
+
+
+def conexao():
+    """Conexão SQLite da thread atual (o sqlite3 não compartilha conexões entre threads)"""
+    con = getattr(_local, 'con', None)
+    if con is None or getattr(_local, 'caminho', None) != DB_PATH:
+        con = sqlite3.connect(DB_PATH, timeout=30)
+        con.row_factory = sqlite3.Row
+        # WAL: leituras da API não bloqueiam a gravação de um lote
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("PRAGMA foreign_keys=ON")
+        with _schema_lock:
+            if DB_PATH not in _schema_criado:
+                con.executescript(SCHEMA)
+                migrarSchema(con)
+                _schema_criado.add(DB_PATH)
+        _local.con = con
+        _local.caminho = DB_PATH
+    return con
+
+
+# Colunas adicionadas depois da primeira versão do schema: (tabela, coluna, definição)
+MIGRACOES = [
+    ('resultados', 'tipo', "TEXT NOT NULL DEFAULT 'imagem'"),
+    ('resultados', 'metricas_video', "TEXT"),
+    ('resultados', 'sha256', "TEXT"),
+    ('resultados', 'assinatura_modelo', "TEXT"),
+    ('resultados', 'arquivo', "TEXT"),
+]
+
+
+def migrarSchema(con):
+    """Adiciona em bancos antigos as colunas que ainda não existem"""
+    for tabela, coluna, definicao in MIGRACOES:
+        colunas = {linha[1] for linha in con.execute(f"PRAGMA table_info({tabela})")}
+        if coluna not in colunas:
+            con.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+    # Fica fora do SCHEMA porque depende de colunas que bancos antigos só têm depois da migração
+    con.execute("CREATE INDEX IF NOT EXISTS idx_resultados_sha256 ON resultados(sha256, assinatura_modelo)")
+    # Substituído por idx_deteccoes_resultado_classe (filtro por classe com EXISTS)
+    con.execute("DROP INDEX IF EXISTS idx_deteccoes_resultado")
+    con.commit()
+
+
+def agora():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def salvarLote(resultados):
+    """
+    Grava um lote de upload com todos os seus resultados numa única transação.
+
+    Args:
+        resultados (list): Resultados de processImages / processVideo, na ordem do lote
+
+    Returns:
+        int: Id do lote criado
+    """
+    con = conexao()
+    criado_em = agora()
+    dia = criado_em[:10]
+
+    with con:
+        lote_id = con.execute(
+            "INSERT INTO lotes (criado_em, total_imagens) VALUES (?, ?)",
+            (criado_em, len(resultados))
+        ).lastrowid
+
+        contagens = {}
+        for resultado in resultados:
+            dados = resultado.get('dados_json')
+            resultado_id = con.execute(
+                """INSERT INTO resultados (lote_id, criado_em, imagem_original, imagem_resultado,
+                       sucesso, erro, mensagem_ia, dados_json, origem_analise, relatorio_bruto,
+                       total_objetos, tempo_ms, tipo, metricas_video, sha256, assinatura_modelo, arquivo)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (lote_id, criado_em, resultado['imagem_original'], resultado.get('imagem_resultado'),
+                 int(resultado['sucesso']), resultado.get('erro'), resultado.get('mensagem_ia'),
+                 json.dumps(dados, ensure_ascii=False) if dados is not None else None,
+                 resultado.get('origem_analise'), resultado.get('relatorio_bruto'),
+                 resultado.get('total_objetos', 0), resultado.get('tempo_ms'),
+                 resultado.get('tipo', 'imagem'),
+                 json.dumps(resultado['metricas_video']) if resultado.get('metricas_video') else None,
+                 resultado.get('sha256'), resultado.get('assinatura_modelo'), resultado.get('arquivo'))
+            ).lastrowid
+
+            deteccoes = resultado.get('deteccoes', [])
+            con.executemany(
+                """INSERT INTO deteccoes (resultado_id, lote_id, criado_em, classe, confianca,
+                       x, y, width, height)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(resultado_id, lote_id, criado_em, d['classe'], d['confianca'],
+                  d.get('x'), d.get('y'), d.get('width'), d.get('height')) for d in deteccoes]
+            )
+            for d in deteccoes:
+                contagens[d['classe']] = contagens.get(d['classe'], 0) + 1
+
+        con.executemany(
+            """INSERT INTO contagem_diaria (dia, classe, total) VALUES (?, ?, ?)
+               ON CONFLICT (dia, classe) DO UPDATE SET total = total + excluded.total""",
+            [(dia, classe, total) for classe, total in contagens.items()]
+        )
+        con.executemany(
+            "INSERT INTO contagem_lote (lote_id, classe, total) VALUES (?, ?, ?)",
+            [(lote_id, classe, total) for classe, total in contagens.items()]
+        )
+
+    return lote_id
+
+
+def linhaParaResultado(linha):
+    """Converte uma linha da tabela resultados no mesmo formato devolvido por /upload"""
+    resultado = {
+        'id': linha['id'],
+        'lote_id': linha['lote_id'],
+        'criado_em': linha['criado_em'],
+        'sucesso': bool(linha['sucesso']),
+        'imagem_original': linha['imagem_original'],
+        'tipo': linha['tipo'],
+    }
+    if linha['metricas_video']:
+        resultado['metricas_video'] = json.loads(linha['metricas_video'])
+    if linha['sucesso']:
+        resultado.update({
+            # Nome em disco; registros antigos só têm imagem_original
+            'arquivo': linha['arquivo'],
+            'imagem_resultado': linha['imagem_resultado'],
+            'mensagem_ia': linha['mensagem_ia'],
+            'dados_json': json.loads(linha['dados_json']) if linha['dados_json'] else None,
+            'origem_analise': linha['origem_analise'],
+            'total_objetos': linha['total_objetos'],
+            'tempo_ms': linha['tempo_ms'],
+        })
+    else:
+        resultado['erro'] = linha['erro']
+    return resultado
+
+
+def buscarPorHash(sha256, assinatura_modelo, origem_analise=None):
+    """
+    Último resultado com sucesso de uma imagem idêntica, processada pelo mesmo modelo.
+
+    Args:
+        sha256 (str): Hash do arquivo enviado
+        assinatura_modelo (str): Modelo e limiares em uso (predictDetector.assinaturaModelo)
+        origem_analise (str): Exige a mesma origem da análise (ex.: 'gemini' quando o resumo foi pedido)
+
+    Returns:
+        dict: Resultado no formato de processSingleImageAsync (com as detecções), ou None
+    """
+    con = conexao()
+    params = [sha256, assinatura_modelo]
+    filtro_origem = ""
+    if origem_analise:
+        filtro_origem = "AND origem_analise = ?"
+        params.append(origem_analise)
+
+    linha = con.execute(
+        f"""SELECT * FROM resultados
+            WHERE sha256 = ? AND assinatura_modelo = ? AND sucesso = 1 AND tipo = 'imagem' {filtro_origem}
+            ORDER BY id DESC LIMIT 1""",
+        params
+    ).fetchone()
+    if linha is None:
+        return None
+
+    deteccoes = con.execute(
+        "SELECT classe, confianca, x, y, width, height FROM deteccoes WHERE resultado_id = ? ORDER BY id",
+        (linha['id'],)
+    ).fetchall()
+
+    resultado = linhaParaResultado(linha)
+    for chave in ('id', 'lote_id', 'criado_em'):
+        resultado.pop(chave)
+    resultado['relatorio_bruto'] = linha['relatorio_bruto']
+    resultado['deteccoes'] = [dict(d) for d in deteccoes]
+    return resultado
+
+
+def faixaDeIds(con, desde=None, ate=None):
+    """
+    Converte o intervalo de datas numa faixa de ids de resultados.
+
+    Os ids crescem junto com `criado_em`, então o primeiro resultado a partir
+    de `desde` e o último até `ate` (uma busca cada no índice de data) delimitam
+    todos os resultados do intervalo.
+
+    Returns:
+        tuple: (id_minimo, id_maximo), com None no lado sem limite, ou None se
+            nenhum resultado cai no intervalo
+    """
+    id_minimo = id_maximo = None
+    if desde:
+        linha = con.execute(
+            "SELECT id FROM resultados WHERE criado_em >= ? ORDER BY criado_em, id LIMIT 1", (desde,)
+        ).fetchone()
+        if linha is None:
+            return None
+        id_minimo = linha['id']
+    if ate:
+        linha = con.execute(
+            "SELECT id FROM resultados WHERE criado_em <= ? ORDER BY criado_em DESC, id DESC LIMIT 1", (ate,)
+        ).fetchone()
+        if linha is None:
+            return None
+        id_maximo = linha['id']
+    return id_minimo, id_maximo
+
+
+def listarResultados(limite=LIMITE_PADRAO, cursor=None, lote_id=None, classe=None, desde=None, ate=None):
+    """
+    Página de resultados, do mais recente para o mais antigo. Com `lote_id`,
+    na ordem de envio do lote (mesma ordem da resposta do /upload).
+
+    Args:
+        limite (int): Itens por página (máximo LIMITE_MAXIMO)
+        cursor (int): `proximo_cursor` devolvido pela página anterior
+        lote_id (int): Filtra por lote de upload
+        classe (str): Apenas resultados com ao menos uma detecção da classe
+        desde, ate (str): Intervalo de data/hora (UTC, 'AAAA-MM-DD[ HH:MM:SS]')
+
+    Returns:
+        dict: {'resultados': [...], 'proximo_cursor': int ou None}
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    con = conexao()
+    condicoes, params = [], []
+    # Dentro de um lote a paginação é crescente: os ids seguem a ordem de envio
+    crescente = lote_id is not None
+
+    # Todas as condições viram faixas de id ou testes por linha, para que a
+    # página seja lida andando pela chave primária (ou pelo índice do lote) já
+    # na ordem certa, sem montar listas nem ordenar o resultado inteiro
+    faixa = faixaDeIds(con, desde, ate)
+    if faixa is None:
+        return {'resultados': [], 'proximo_cursor': None}
+    id_minimo, id_maximo = faixa
+    if id_minimo is not None:
+        condicoes.append("r.id >= ?")
+        params.append(id_minimo)
+    if id_maximo is not None:
+        condicoes.append("r.id <= ?")
+        params.append(id_maximo)
+
+    if cursor is not None:
+        condicoes.append("r.id > ?" if crescente else "r.id < ?")
+        params.append(int(cursor))
+    if lote_id is not None:
+        condicoes.append("r.lote_id = ?")
+        params.append(int(lote_id))
+    if classe:
+        condicoes.append("EXISTS (SELECT 1 FROM deteccoes d WHERE d.resultado_id = r.id AND d.classe = ?)")
+        params.append(classe)
+
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    # Busca um item a mais para saber se existe próxima página
+    linhas = con.execute(
+        f"SELECT * FROM resultados r {where} ORDER BY r.id {'ASC' if crescente else 'DESC'} LIMIT ?",
+        params + [limite + 1]
+    ).fetchall()
+
+    proximo_cursor = linhas[limite - 1]['id'] if len(linhas) > limite else None
+    return {
+        'resultados': [linhaParaResultado(l) for l in linhas[:limite]],
+        'proximo_cursor': proximo_cursor
+    }
+
+
+def contagemPorDia(desde=None, ate=None, classe=None):
+    """Contagem de detecções por dia e classe (lida da tabela de agregado)"""
+    condicoes, params = [], []
+    if desde:
+        condicoes.append("dia >= ?")
+        params.append(desde[:10])
+    if ate:
+        condicoes.append("dia <= ?")
+        params.append(ate[:10])
+    if classe:
+        condicoes.append("classe = ?")
+        params.append(classe)
+
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    linhas = conexao().execute(
+        f"SELECT dia, classe, total FROM contagem_diaria {where} ORDER BY dia DESC, classe",
+        params
+    ).fetchall()
+    return [dict(l) for l in linhas]
+
+
+def contagemPorLote(lote_id=None, classe=None, limite=LIMITE_PADRAO):
+    """Contagem de detecções por lote e classe, dos lotes mais recentes para os mais antigos"""
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    if lote_id is not None:
+        lotes = [int(lote_id)]
+    else:
+        lotes = [l['id'] for l in conexao().execute(
+            "SELECT id FROM lotes ORDER BY id DESC LIMIT ?", (limite,))]
+    if not lotes:
+        return []
+
+    marcadores = ','.join('?' * len(lotes))
+    params = list(lotes)
+    filtro_classe = ""
+    if classe:
+        filtro_classe = "AND classe = ?"
+        params.append(classe)
+
+    linhas = conexao().execute(
+        f"""SELECT lote_id, classe, total FROM contagem_lote
+            WHERE lote_id IN ({marcadores}) {filtro_classe}
+            ORDER BY lote_id DESC, classe""",
+        params
+    ).fetchall()
+    return [dict(l) for l in linhas]
@@ -0,0 +1,357 @@
+import hashlib
+import os
+import struct
+import tempfile
+from collections import namedtuple
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+"""
+INGESTÃO DE UPLOADS EM STREAMING
+
+Lê o corpo multipart do /upload em blocos, à medida que ele chega, em vez de
+esperar o request inteiro (request.files):
+
+- Cada arquivo é gravado em disco bloco a bloco, sem ficar inteiro na memória
+- O tipo real (bytes mágicos) e as dimensões são validados pelo cabeçalho,
+  antes de ler o resto do arquivo; arquivos inválidos são descartados na hora
+- O sha256 é calculado durante a leitura (deduplicação e cache de resultados)
+- Cada arquivo é entregue assim que a sua parte termina, para que o
+  processamento comece enquanto as próximas ainda estão chegando
+"""
+
+# Tamanho dos blocos lidos do corpo da requisição
+TAMANHO_BLOCO = 64 * 1024
+
+# Limite por imagem, por vídeo, do lote inteiro (MAX_CONTENT_LENGTH) e maior lado aceito (pixels)
+MAX_ARQUIVO = int(os.getenv("UPLOAD_MAX_ARQUIVO_MB", 16)) * 1024 * 1024
+MAX_VIDEO = int(os.getenv("UPLOAD_MAX_VIDEO_MB", 256)) * 1024 * 1024
+MAX_LOTE = int(os.getenv("UPLOAD_MAX_LOTE_MB", 512)) * 1024 * 1024
+MAX_LADO = int(os.getenv("UPLOAD_MAX_LADO", 10000))
+
+# Campos de texto (resumo_ia, modo_video) e número máximo de partes
+MAX_CAMPO = 64 * 1024
+MAX_PARTES = 1000
+
+# Quanto do início do arquivo pode ficar em memória até o cabeçalho ser reconhecido
+# (num JPEG, EXIF/ICC/XMP podem vir antes das dimensões)
+CABECALHO_MAX = 1024 * 1024
+
+CampoRecebido = namedtuple('CampoRecebido', ['nome', 'valor'])
+
+
+class UploadInvalido(Exception):
+    """Corpo multipart malformado ou truncado"""
+
+
+class ArquivoInvalido(Exception):
+    """Conteúdo do arquivo não corresponde a um formato aceito"""
+
+
+# ====================================
+# RECONHECIMENTO PELO CABEÇALHO
+# ====================================
+
+# Marcadores SOF do JPEG (exceto DHT 0xC4, JPG 0xC8 e DAC 0xCC), que trazem as dimensões
+MARCADORES_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def dimensoesJpeg(dados):
+    """Percorre os segmentos do JPEG até o SOF. Retorna (largura, altura) ou None se faltam bytes"""
+    pos = 2
+    while True:
+        if pos + 4 > len(dados):
+            return None
+        if dados[pos] != 0xFF:
+            raise ArquivoInvalido("JPEG corrompido")
+        marcador = dados[pos + 1]
+        if marcador == 0xFF:
+            # Bytes de preenchimento entre segmentos
+            pos += 1
+            continue
+        if marcador == 0x01 or 0xD0 <= marcador <= 0xD8:
+            pos += 2
+            continue
+        if marcador in (0xD9, 0xDA):
+            raise ArquivoInvalido("JPEG sem dimensões antes dos dados da imagem")
+
+        tamanho = struct.unpack('>H', dados[pos + 2:pos + 4])[0]
+        if marcador in MARCADORES_SOF:
+            if pos + 9 > len(dados):
+                return None
+            altura, largura = struct.unpack('>HH', dados[pos + 5:pos + 9])
+            return largura, altura
+        pos += 2 + tamanho
+
+
+def dimensoesWebp(dados):
+    """Dimensões dos três formatos de WebP (com perdas, sem perdas e estendido)"""
+    if len(dados) < 30:
+        return None
+    bloco = dados[12:16]
+    if bloco == b'VP8 ':
+        if dados[23:26] != b'\x9d\x01\x2a':
+            raise ArquivoInvalido("WebP corrompido")
+        largura, altura = struct.unpack('<HH', dados[26:30])
+        return largura & 0x3FFF, altura & 0x3FFF
+    if bloco == b'VP8L':
+        if dados[20] != 0x2F:
+            raise ArquivoInvalido("WebP corrompido")
+        bits = struct.unpack('<I', dados[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if bloco == b'VP8X':
+        largura = int.from_bytes(dados[24:27], 'little') + 1
+        altura = int.from_bytes(dados[27:30], 'little') + 1
+        return largura, altura
+    raise ArquivoInvalido("WebP com formato desconhecido")
+
+
+def identificarFormato(dados):
+    """
+    Reconhece o formato pelos bytes mágicos e lê as dimensões do cabeçalho.
+
+    Nos vídeos só o contêiner é conferido; as dimensões são validadas pelo
+    OpenCV ao abrir o arquivo.
+
+    Returns:
+        tuple: (tipo, formato, largura, altura), com tipo 'imagem' ou 'video';
+            None se ainda faltam bytes para decidir
+    Raises:
+        ArquivoInvalido: formato não reconhecido ou cabeçalho corrompido
+    """
+    if len(dados) < 12:
+        return None
+
+    if dados.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(dados) < 24:
+            return None
+        if dados[12:16] != b'IHDR':
+            raise ArquivoInvalido("PNG corrompido")
+        largura, altura = struct.unpack('>II', dados[16:24])
+        return 'imagem', 'png', largura, altura
+
+    if dados.startswith(b'\xff\xd8\xff'):
+        dimensoes = dimensoesJpeg(dados)
+        return ('imagem', 'jpeg') + dimensoes if dimensoes else None
+
+    if dados.startswith(b'BM'):
+        if len(dados) < 26:
+            return None
+        tamanho_dib = struct.unpack('<I', dados[14:18])[0]
+        if tamanho_dib == 12:
+            largura, altura = struct.unpack('<HH', dados[18:22])
+        else:
+            largura, altura = struct.unpack('<ii', dados[18:26])
+        # Altura negativa = imagem gravada de cima para baixo
+        return 'imagem', 'bmp', largura, abs(altura)
+
+    if dados.startswith(b'RIFF') and dados[8:12] == b'WEBP':
+        dimensoes = dimensoesWebp(dados)
+        return ('imagem', 'webp') + dimensoes if dimensoes else None
+
+    if dados.startswith(b'RIFF') and dados[8:12] == b'AVI ':
+        return 'video', 'avi', None, None
+
+    if dados[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+        return 'video', 'mp4', None, None
+
+    if dados.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video', 'matroska', None, None
+
+    raise ArquivoInvalido("Formato de arquivo não reconhecido")
+
+
+# ====================================
+# ARQUIVO EM RECEBIMENTO
+# ====================================
+
+class ArquivoRecebido:
+    """
+    Uma parte de arquivo do multipart, gravada em disco conforme chega.
+
+    Ao final (`concluir`), ou `erro` explica por que o arquivo foi recusado,
+    ou `caminho` aponta para o arquivo salvo em `pasta` com o prefixo do hash.
+    """
+
+    def __init__(self, nome_original, pasta, extensoes_imagem, extensoes_video):
+        self.nome_original = nome_original
+        self.pasta = pasta
+        extensao = nome_original.rsplit('.', 1)[1].lower() if '.' in nome_original else ''
+        # Nome seguro: é o único que vai para o disco, para as respostas e para o histórico
+        self.nome = secure_filename(nome_original) or secure_filename(f"arquivo.{extensao}")
+
+        if extensao in extensoes_imagem:
+            self.tipo = 'imagem'
+        elif extensao in extensoes_video:
+            self.tipo = 'video'
+        else:
+            self.tipo = None
+
+        self.formato = None
+        self.largura = None
+        self.altura = None
+        self.tamanho = 0
+        self.sha256 = None
+        self.caminho = None
+        self.ja_existia = False     # Mesmo conteúdo já salvo por um upload anterior
+        self.limite = MAX_VIDEO if self.tipo == 'video' else MAX_ARQUIVO
+        self.erro = None if self.tipo else "Tipo de arquivo não permitido"
+
+        self._hash = hashlib.sha256()
+        self._cabecalho = bytearray()
+        self._arquivo = None
+        self._parcial = None
+        if not self.erro:
+            descritor, self._parcial = tempfile.mkstemp(prefix='.parcial-', dir=pasta)
+            self._arquivo = os.fdopen(descritor, 'wb')
+
+    def receber(self, dados):
+        """Recebe um bloco da parte: valida o cabeçalho, atualiza o hash e grava em disco"""
+        if self.erro:
+            # Arquivo já recusado: o resto da parte é só descartado
+            return
+
+        self.tamanho += len(dados)
+        if self.tamanho > self.limite:
+            self.recusar(f"Arquivo maior que {self.limite // (1024 * 1024)} MB")
+            return
+        self._hash.update(dados)
+
+        if self._cabecalho is None:
+            self._arquivo.write(dados)
+            return
+
+        # Ainda no cabeçalho: acumula até reconhecer o formato
+        self._cabecalho += dados
+        try:
+            formato = identificarFormato(bytes(self._cabecalho))
+        except ArquivoInvalido as e:
+            self.recusar(str(e))
+            return
+        if formato is None:
+            if len(self._cabecalho) >= CABECALHO_MAX:
+                self.recusar("Cabeçalho do arquivo não reconhecido")
+            return
+
+        tipo, self.formato, self.largura, self.altura = formato
+        if tipo != self.tipo:
+            self.recusar(f"Conteúdo ({self.formato}) não corresponde à extensão do arquivo")
+            return
+        if tipo == 'imagem':
+            if not self.largura or not self.altura:
+                self.recusar("Imagem sem dimensões válidas")
+                return
+            if max(self.largura, self.altura) > MAX_LADO:
+                self.recusar(f"Imagem de {self.largura}x{self.altura} excede o limite de {MAX_LADO} pixels por lado")
+                return
+
+        self._arquivo.write(self._cabecalho)
+        self._cabecalho = None
+
+    def recusar(self, motivo):
+        self.erro = motivo
+        self.descartar()
+
+    def descartar(self):
+        """Fecha e apaga o arquivo parcial (recusa ou requisição interrompida)"""
+        if self._arquivo:
+            self._arquivo.close()
+            self._arquivo = None
+        if self._parcial and os.path.exists(self._parcial):
+            os.remove(self._parcial)
+        self._parcial = None
+
+    def concluir(self):
+        """Fim da parte: move o arquivo para o nome definitivo (prefixado pelo hash)"""
+        if not self.erro:
+            if self.tamanho == 0:
+                self.recusar("Arquivo vazio")
+            elif self._cabecalho is not None:
+                self.recusar("Arquivo truncado ou com cabeçalho não reconhecido")
+
+        if self.erro:
+            return self
+
+        self._arquivo.close()
+        self._arquivo = None
+        self.sha256 = self._hash.hexdigest()
+        # O prefixo evita que uploads diferentes com o mesmo nome se sobrescrevam
+        self.caminho = os.path.join(self.pasta, f"{self.sha256[:12]}_{self.nome}")
+        self.ja_existia = os.path.exists(self.caminho)
+        os.replace(self._parcial, self.caminho)
+        self._parcial = None
+        return self
+
+    def remover(self):
+        """Apaga o arquivo salvo por este upload (requisição recusada depois de recebê-lo)"""
+        if self.caminho and not self.ja_existia and os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+
+# ====================================
+# LEITURA DO MULTIPART
+# ====================================
+
+def lerUpload(stream, boundary, pasta, extensoes_imagem, extensoes_video):
+    """
+    Lê o corpo multipart em blocos e entrega cada parte assim que ela termina.
+
+    Args:
+        stream: Corpo da requisição (request.stream)
+        boundary (str): Boundary do Content-Type
+        pasta (str): Onde gravar os arquivos
+        extensoes_imagem, extensoes_video (set): Extensões aceitas
+
+    Yields:
+        CampoRecebido ou ArquivoRecebido (já concluído: válido ou com `erro`)
+
+    Raises:
+        UploadInvalido: corpo malformado ou interrompido
+    """
+    # max_form_memory_size limita o buffer interno do decoder: o bloco atual mais o
+    # que sobrou do anterior (cabeçalhos da parte, trecho que pode ser o boundary)
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=TAMANHO_BLOCO + MAX_CAMPO,
+                               max_parts=MAX_PARTES)
+    atual = None
+    valor_campo = bytearray()
+
+    try:
+        while True:
+            bloco = stream.read(TAMANHO_BLOCO)
+            decoder.receive_data(bloco or None)
+            try:
+                evento = decoder.next_event()
+                while not isinstance(evento, (NeedData, Epilogue)):
+                    if isinstance(evento, Field):
+                        atual = evento
+                        valor_campo = bytearray()
+                    elif isinstance(evento, File):
+                        # Input de arquivo vazio (nenhum arquivo selecionado) é ignorado
+                        atual = ArquivoRecebido(evento.filename, pasta, extensoes_imagem, extensoes_video) \
+                            if evento.filename else None
+                    elif isinstance(evento, Data):
+                        if isinstance(atual, ArquivoRecebido):
+                            atual.receber(evento.data)
+                        elif isinstance(atual, Field):
+                            valor_campo += evento.data
+                            if len(valor_campo) > MAX_CAMPO:
+                                raise UploadInvalido(f"Campo '{atual.name}' muito grande")
+
+                        if not evento.more_data:
+                            if isinstance(atual, ArquivoRecebido):
+                                yield atual.concluir()
+                            elif isinstance(atual, Field):
+                                yield CampoRecebido(atual.name, valor_campo.decode('utf-8', 'replace'))
+                            atual = None
+                    evento = decoder.next_event()
+            except ValueError as e:
+                raise UploadInvalido(f"Corpo multipart inválido: {e}")
+
+            if isinstance(evento, Epilogue):
+                break
+            if not bloco:
+                raise UploadInvalido("Corpo multipart incompleto")
+    finally:
+        # Requisição interrompida no meio de um arquivo: não deixa o parcial no disco
+        if isinstance(atual, ArquivoRecebido):
+            atual.descartar()
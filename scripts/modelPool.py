@@ -0,0 +1,179 @@
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+POOL DE MODELOS COM CONTROLE DE ADMISSÃO
+
+Mantém N instâncias do detector, cada uma com um limite de lotes
+simultâneos (em voo). Cada lote (um upload) reserva uma vaga uma única vez.
+Quem não encontra vaga entra numa fila limitada e espera até
+`timeout_espera` segundos. Quando a fila está cheia a requisição é recusada
+imediatamente, em vez de acumular trabalho no servidor.
+"""
+
+
+class PoolSaturadoError(Exception):
+    """Erro lançado quando o pool não consegue admitir uma nova requisição.
+
+    Attributes:
+        motivo (str): 'fila_cheia' (recusada na entrada) ou 'timeout' (esperou demais)
+        retry_after (int): Segundos sugeridos ao cliente antes de tentar novamente
+    """
+
+    def __init__(self, motivo, retry_after):
+        self.motivo = motivo
+        self.retry_after = retry_after
+        super().__init__(f"Pool de modelos saturado ({motivo}), tente novamente em {retry_after}s")
+
+
+class ModelPool:
+    """
+    Pool thread-safe de instâncias do detector.
+
+    As instâncias são criadas sob demanda pela `factory` na primeira vez que
+    a vaga correspondente é usada, então o custo de carregamento só é pago
+    quando há carga para isso.
+
+    Args:
+        factory (callable): Função sem argumentos que cria uma nova instância do modelo
+        tamanho (int): Número de instâncias do modelo
+        max_em_voo (int): Requisições simultâneas permitidas por instância
+        max_fila (int): Máximo de requisições aguardando vaga
+        timeout_espera (float): Tempo máximo de espera na fila, em segundos
+    """
+
+    def __init__(self, factory, tamanho=2, max_em_voo=1, max_fila=16, timeout_espera=30.0):
+        if tamanho < 1 or max_em_voo < 1:
+            raise ValueError("O pool precisa de ao menos 1 instância com 1 vaga")
+
+        self.factory = factory
+        self.tamanho = tamanho
+        self.max_em_voo = max_em_voo
+        self.max_fila = max_fila
+        self.timeout_espera = timeout_espera
+
+        self._condicao = threading.Condition()
+        self._instancias = [None] * tamanho
+        self._locks_criacao = [threading.Lock() for _ in range(tamanho)]
+        self._em_voo = [0] * tamanho
+        self._na_fila = 0
+
+        # Métricas acumuladas (observabilidade)
+        self._total_admitidas = 0
+        self._total_recusadas_fila = 0
+        self._total_recusadas_timeout = 0
+        self._espera_total_s = 0.0
+        self._espera_max_s = 0.0
+
+    # ===================================================================
+    # ADMISSÃO
+    # ===================================================================
+    def _vagaLivre(self):
+        """Retorna o índice da instância menos ocupada com vaga, ou None"""
+        melhor = None
+        for i, ocupadas in enumerate(self._em_voo):
+            if ocupadas < self.max_em_voo and (melhor is None or ocupadas < self._em_voo[melhor]):
+                melhor = i
+        return melhor
+
+    def retryAfter(self):
+        """Estimativa (em segundos) de quando vale a pena o cliente tentar de novo"""
+        espera_media = self._espera_total_s / self._total_admitidas if self._total_admitidas else 1.0
+        return max(1, int(round(espera_media + 0.5)))
+
+    def reservar(self):
+        """
+        Reserva uma vaga em alguma instância, bloqueando na fila se necessário.
+
+        Returns:
+            int: Índice da instância reservada (deve ser devolvido com `liberar`)
+
+        Raises:
+            PoolSaturadoError: Se a fila estiver cheia ou o tempo de espera acabar
+        """
+        inicio = time.monotonic()
+        with self._condicao:
+            indice = self._vagaLivre()
+
+            if indice is None:
+                if self._na_fila >= self.max_fila:
+                    self._total_recusadas_fila += 1
+                    raise PoolSaturadoError('fila_cheia', self.retryAfter())
+
+                self._na_fila += 1
+                try:
+                    prazo = inicio + self.timeout_espera
+                    while indice is None:
+                        restante = prazo - time.monotonic()
+                        if restante <= 0:
+                            self._total_recusadas_timeout += 1
+                            raise PoolSaturadoError('timeout', self.retryAfter())
+                        self._condicao.wait(restante)
+                        indice = self._vagaLivre()
+                finally:
+                    self._na_fila -= 1
+
+            self._em_voo[indice] += 1
+            espera = time.monotonic() - inicio
+            self._total_admitidas += 1
+            self._espera_total_s += espera
+            self._espera_max_s = max(self._espera_max_s, espera)
+            return indice
+
+    def liberar(self, indice):
+        """Devolve a vaga reservada por `reservar` e acorda quem está na fila"""
+        with self._condicao:
+            self._em_voo[indice] -= 1
+            self._condicao.notify()
+
+    def instancia(self, indice):
+        """Obtém (criando na primeira vez) a instância do modelo da vaga `indice`"""
+        if self._instancias[indice] is None:
+            # Lock por vaga: duas threads na mesma instância não criam o modelo duas vezes
+            with self._locks_criacao[indice]:
+                if self._instancias[indice] is None:
+                    self._instancias[indice] = self.factory()
+        return self._instancias[indice]
+
+    @contextmanager
+    def vaga(self):
+        """
+        Reserva uma vaga para um lote inteiro (um upload), devolvida ao final.
+
+        A admissão é feita uma vez por lote: as imagens do lote não disputam
+        vagas entre si.
+
+        Exemplo:
+            with pool.vaga() as indice:
+                futuros = [despacharImagem(c, indice_modelo=indice) for c in caminhos]
+                resultados = coletarImagens(list(zip(caminhos, futuros)))
+        """
+        indice = self.reservar()
+        try:
+            yield indice
+        finally:
+            self.liberar(indice)
+
+    # ===================================================================
+    # OBSERVABILIDADE
+    # ===================================================================
+    def estatisticas(self):
+        """Retorna um retrato das métricas do pool (para dimensionar os nós)"""
+        with self._condicao:
+            admitidas = self._total_admitidas
+            return {
+                'tamanho_pool': self.tamanho,
+                'max_em_voo_por_instancia': self.max_em_voo,
+                'instancias_carregadas': sum(1 for m in self._instancias if m is not None),
+                'em_voo': sum(self._em_voo),
+                'em_voo_por_instancia': list(self._em_voo),
+                'fila_atual': self._na_fila,
+                'fila_maxima': self.max_fila,
+                'timeout_espera_s': self.timeout_espera,
+                'total_admitidas': admitidas,
+                'total_recusadas_fila_cheia': self._total_recusadas_fila,
+                'total_recusadas_timeout': self._total_recusadas_timeout,
+                'espera_media_ms': round(self._espera_total_s / admitidas * 1000, 2) if admitidas else 0.0,
+                'espera_max_ms': round(self._espera_max_s * 1000, 2),
+            }
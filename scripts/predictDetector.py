@@ -1,10 +1,16 @@
+import asyncio
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 from roboflow import Roboflow
 from collections import Counter
-from gemini import runChat
 from preProcessingImages import preprocess_image
+from modelPool import ModelPool
+from asyncClients import ClientesAsync
+from regrasInferencia import analisarDeteccoes
 import json
 import os
+import threading
 from dotenv import load_dotenv
 
 # Carrega variáveis de ambiente do arquivo .env
@@ -18,67 +24,125 @@ CONFIDENCE_THRESHOLD = 60  # 60% de confiança mínima.
 # Controla quantas detecções sobrepostas são eliminadas
 OVERLAP_THRESHOLD = 30  # 30% de sobreposição permitida.
 
-# Configuração global do modelo
-model = None
+# Configuração do pool de modelos (ver modelPool.py)
+# Instâncias do modelo, lotes simultâneos por instância, tamanho máximo da
+# fila de espera e tempo máximo de espera (segundos). Cada upload ocupa uma
+# vaga; com o detector hospedado nenhuma instância é criada e as vagas só
+# limitam os lotes simultâneos (as chamadas remotas seguem DETECTOR_CONCURRENCY)
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", 2))
+MODEL_MAX_IN_FLIGHT = int(os.getenv("MODEL_MAX_IN_FLIGHT", 1))
+MODEL_QUEUE_SIZE = int(os.getenv("MODEL_QUEUE_SIZE", 16))
+MODEL_QUEUE_TIMEOUT = float(os.getenv("MODEL_QUEUE_TIMEOUT", 30))
 
-def loadModel():
-    """Carrega o modelo do Roboflow, lendo as configurações do ambiente."""
-    global model
-    if model is None:
-        try:
-            api_key = os.getenv("API_KEY_ROBOFLOW")
-            workspace = os.getenv("ROBOFLOW_WORKSPACE", "trabalhoaps-wnnex")
-            project_name = os.getenv("ROBOFLOW_PROJECT", "constructionaps-twwga")
-            version = int(os.getenv("ROBOFLOW_VERSION", 1))
+# Modelo hospedado no Roboflow
+ROBOFLOW_WORKSPACE = os.getenv("ROBOFLOW_WORKSPACE", "trabalhoaps-wnnex")
+ROBOFLOW_PROJECT = os.getenv("ROBOFLOW_PROJECT", "constructionaps-twwga")
+ROBOFLOW_VERSION = int(os.getenv("ROBOFLOW_VERSION", 1))
 
-            if not api_key:
-                raise ValueError("Chave de API do Roboflow (API_KEY_ROBOFLOW) não encontrada no arquivo .env")
+# Pasta dos uploads e das imagens de resultado (a mesma servida pelo app.py)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 
-            print(f"Carregando modelo do Roboflow: {workspace}/{project_name}/{version}")
-            
-            # Inicializa Roboflow
-            rf = Roboflow(api_key=api_key)
-            
-            # Obtém projeto e modelo
-            project = rf.workspace(workspace).project(project_name)
-            model = project.version(version).model
-            
-            print("Modelo do Roboflow carregado com sucesso!")
-            
-        except Exception as e:
-            print(f"Erro ao carregar o modelo do Roboflow: {e}")
-            model = None
-            raise
-    return model
+# Modelo local (ONNX gerado por exportModel.py). Se definido, substitui o
+# modelo hospedado no Roboflow; ONNX_THREADS = threads de CPU por instância
+MODELO_ONNX = os.getenv("MODELO_ONNX")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", 0)) or None
+
+# Pool de modelos (ver getPool)
+pool = None
+_pool_lock = threading.Lock()
 
-def preProcessImage(image_path):
-    """Pré-processa a imagem para garantir compatibilidade e melhorar qualidade"""
+# Clientes assíncronos (detector hospedado e Gemini), ver asyncClients.py
+clientes = None
+_clientes_lock = threading.Lock()
+
+# Executores da inferência local, um por instância do pool (fora do executor padrão do loop)
+_executores_onnx = {}
+_executores_lock = threading.Lock()
+
+def criarModelo():
+    """Cria uma nova instância do modelo (ONNX local ou Roboflow), lendo as configurações do ambiente."""
+    if MODELO_ONNX:
+        # Importado aqui para que o onnxruntime só seja exigido quando o modelo local é usado
+        from detectorOnnx import DetectorOnnx
+        print(f"Carregando modelo local ONNX: {MODELO_ONNX} (threads: {ONNX_THREADS or 'padrão'})")
+        return DetectorOnnx(MODELO_ONNX, threads=ONNX_THREADS)
+    
     try:
-        # Lê a imagem
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Não foi possível carregar a imagem: {image_path}")
+        api_key = os.getenv("API_KEY_ROBOFLOW")
+
+        if not api_key:
+            raise ValueError("Chave de API do Roboflow (API_KEY_ROBOFLOW) não encontrada no arquivo .env")
+
+        print(f"Carregando modelo do Roboflow: {ROBOFLOW_WORKSPACE}/{ROBOFLOW_PROJECT}/{ROBOFLOW_VERSION}")
+        
+        # Inicializa Roboflow
+        rf = Roboflow(api_key=api_key)
         
-        # Verifica se a imagem está vazia
-        if image.size == 0:
-            raise ValueError("A imagem está vazia")
+        # Obtém projeto e modelo
+        project = rf.workspace(ROBOFLOW_WORKSPACE).project(ROBOFLOW_PROJECT)
+        instancia = project.version(ROBOFLOW_VERSION).model
         
-        # Guarda a imagem original para desenhar as detecções depois
-        imagem_original = image.copy()
+        print("Modelo do Roboflow carregado com sucesso!")
+        return instancia
         
-        # Aplica o pré-processamento do preProcessingImages.py
+    except Exception as e:
+        print(f"Erro ao carregar o modelo do Roboflow: {e}")
+        raise
+
+def getPool():
+    """Retorna o pool de modelos usado na inferência (criado uma única vez, thread-safe)."""
+    global pool
+    if pool is None:
+        with _pool_lock:
+            if pool is None:
+                pool = ModelPool(
+                    criarModelo,
+                    tamanho=MODEL_POOL_SIZE,
+                    max_em_voo=MODEL_MAX_IN_FLIGHT,
+                    max_fila=MODEL_QUEUE_SIZE,
+                    timeout_espera=MODEL_QUEUE_TIMEOUT
+                )
+                print(f"Pool de modelos: {MODEL_POOL_SIZE} instância(s), "
+                      f"{MODEL_MAX_IN_FLIGHT} em voo cada, fila de {MODEL_QUEUE_SIZE}")
+    return pool
+
+def carregarImagem(image_path):
+    """Lê a imagem do disco e aplica o pré-processamento.
+
+    Returns:
+        tuple: (imagem_original, imagem_processada) - a original é usada para desenhar as detecções
+    """
+    # Lê a imagem
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Não foi possível carregar a imagem: {image_path}")
+    
+    # Verifica se a imagem está vazia
+    if image.size == 0:
+        raise ValueError("A imagem está vazia")
+    
+    # Guarda a imagem original para desenhar as detecções depois
+    imagem_original = image.copy()
+    
+    # Aplica o pré-processamento do preProcessingImages.py
 
-        # Isso inclui: redimensionamento, equalização de histograma, redução de ruído e normalização
-        print(f"Aplicando pré-processamento avançado na imagem...")
-        image_processada = preprocess_image(image)
+    # Isso inclui: redimensionamento, equalização de histograma, redução de ruído e normalização
+    print(f"Aplicando pré-processamento avançado na imagem...")
+    image_processada = preprocess_image(image)
+    
+    return imagem_original, image_processada
+
+def preProcessImageBytes(image_path):
+    """Pré-processa a imagem e a codifica em JPEG na memória (para o cliente assíncrono)"""
+    try:
+        imagem_original, image_processada = carregarImagem(image_path)
         
-        # Salva temporariamente a imagem processada para enviar ao modelo
-        temp_path = f"temp_{os.path.basename(image_path)}"
-        cv2.imwrite(temp_path, image_processada)
+        ok, buffer = cv2.imencode('.jpg', image_processada)
+        if not ok:
+            raise ValueError(f"Não foi possível codificar a imagem: {image_path}")
         
-        # Retorna o caminho temporário e a imagem original (não processada) 
-        # para desenhar as detecções na imagem original depois
-        return temp_path, imagem_original
+        return buffer.tobytes(), imagem_original
         
     except Exception as e:
         print(f"Erro no pré-processamento da imagem: {e}")
@@ -153,197 +217,375 @@ def drawDetections(imagem, predictions, scale_x=1.0, scale_y=1.0):
         traceback.print_exc()
         return imagem
 
-def processSingleImage(image_path):
-    """Processa uma única imagem e retorna os dados estruturados"""
-    temp_path = None
-    try:
-        model = loadModel()
-        
-        # Pré-processa a imagem
-        temp_path, imagem_original = preProcessImage(image_path)
-        
-        # Calcular fator de escala (original / processada)
-        img_original_height, img_original_width = imagem_original.shape[:2]
-        # A imagem processada tem 640x640
-        scale_x = img_original_width / 640.0
-        scale_y = img_original_height / 640.0
-        
-        """
-        print(f"📏 Tamanho original: {img_original_width}x{img_original_height}")
-        print(f"📏 Tamanho processado: 640x640")
-        print(f"📏 Fator de escala: {scale_x:.2f}x{scale_y:.2f}")
-        print(f"⚙️ Confiança mínima: {CONFIDENCE_THRESHOLD}%")
-        print(f"Enviando imagem para predição: {os.path.basename(image_path)}")
-        """
-        # Faz a predição usando os thresholds configurados
-        prediction = model.predict(
-            temp_path, 
-            confidence=CONFIDENCE_THRESHOLD,  # Confiança mínima configurável
-            overlap=OVERLAP_THRESHOLD         # Sobreposição máxima (NMS)
-        )
-        
-        # Converte para JSON
-        prediction_data = prediction.json()
-        
-        # Coleta de dados
-        detected_objects = []
-        object_counts = Counter()
-        predictions_data = prediction_data.get('predictions', [])
-        
-        inference_time_ms = prediction_data.get('time', 0) * 1000
-        
-        # Extrair detecções
-        for pred in predictions_data:
-            nome_classe = pred['class']
-            confianca = pred['confidence']
-            
-            detected_objects.append({
-                "classe": nome_classe,
-                "confianca": float(confianca),
-                "x": pred['x'],
-                "y": pred['y'],
-                "width": pred['width'],
-                "height": pred['height']
-            })
-            object_counts[nome_classe] += 1
+def extrairDeteccoes(prediction_data):
+    """Converte a resposta do detector em lista de objetos, contagem por classe e tempo (ms)"""
+    detected_objects = []
+    object_counts = Counter()
+    
+    inference_time_ms = prediction_data.get('time', 0) * 1000
+    
+    # Extrair detecções
+    for pred in prediction_data.get('predictions', []):
+        nome_classe = pred['class']
+        confianca = pred['confidence']
         
-        # Montar relatório para o Gemini
-        relatorio = "=" * 50 + "\n"
-        relatorio += " " * 15 + "📊 RELATÓRIO DE DETECÇÃO 📊\n"
-        relatorio += "=" * 50 + "\n"
-        relatorio += f"🖼️ Imagem Analisada: {os.path.basename(image_path)}\n"
-        relatorio += f"⏱️ Tempo de Análise: {inference_time_ms:.2f} ms\n"
-        relatorio += f"🔢 Total de Objetos Detectados: {len(detected_objects)}\n"
+        detected_objects.append({
+            "classe": nome_classe,
+            "confianca": float(confianca),
+            "x": pred['x'],
+            "y": pred['y'],
+            "width": pred['width'],
+            "height": pred['height']
+        })
+        object_counts[nome_classe] += 1
+    
+    return detected_objects, object_counts, inference_time_ms
+
+def montarRelatorio(image_path, detected_objects, object_counts, inference_time_ms):
+    """Monta o relatório de detecção enviado ao Gemini"""
+    relatorio = "=" * 50 + "\n"
+    relatorio += " " * 15 + "📊 RELATÓRIO DE DETECÇÃO 📊\n"
+    relatorio += "=" * 50 + "\n"
+    relatorio += f"🖼️ Imagem Analisada: {os.path.basename(image_path)}\n"
+    relatorio += f"⏱️ Tempo de Análise: {inference_time_ms:.2f} ms\n"
+    relatorio += f"🔢 Total de Objetos Detectados: {len(detected_objects)}\n"
+    relatorio += "-" * 50 + "\n"
+    
+    if not object_counts:
+        relatorio += "⚪ Nenhum objeto das classes conhecidas foi detectado.\n"
+    else:
+        relatorio += "📋 Resumo por Classe:\n"
+        for obj, count in object_counts.items():
+            relatorio += f"- {obj}: {count} unidade(s)\n"
+    
+    if detected_objects:
         relatorio += "-" * 50 + "\n"
+        relatorio += "🔍 Detalhes Individuais:\n"
+        for i, obj in enumerate(detected_objects, 1):
+            relatorio += f" ➡️ Objeto #{i}:\n"
+            relatorio += f" - Classe: {obj['classe']}\n"
+            relatorio += f" - Confiança: {obj['confianca']:.2%}\n"
+    
+    relatorio += "=" * 50 + "\n"
+    return relatorio
+
+def interpretarRespostaGemini(resposta_gemini):
+    """Separa a mensagem e o JSON da resposta do Gemini"""
+    dados_estruturados = None
+    mensagem_ia = ""
+    
+    if resposta_gemini:
+        try:
+            # Separar mensagem e JSON
+            if "**MENSAGEM:**" in resposta_gemini:
+                partes = resposta_gemini.split("**JSON:**")
+                mensagem_ia = partes[0].replace("**MENSAGEM:**", "").strip()
+                if len(partes) > 1:
+                    json_str = partes[1].strip()
+                    # Remove marcadores de código se existirem
+                    json_str = json_str.replace("```json", "").replace("```", "").strip()
+                    dados_estruturados = json.loads(json_str)
+            elif "```json" in resposta_gemini:
+                inicio_json = resposta_gemini.find("```json") + 7
+                fim_json = resposta_gemini.find("```", inicio_json)
+                json_str = resposta_gemini[inicio_json:fim_json].strip()
+                dados_estruturados = json.loads(json_str)
+                mensagem_ia = resposta_gemini[:inicio_json-7].strip()
+        except Exception as e:
+            print(f" Erro ao extrair JSON: {e}")
+            # Tenta extrair apenas a mensagem
+            mensagem_ia = resposta_gemini
+    
+    return mensagem_ia, dados_estruturados
+
+def salvarImagemResultado(image_path, imagem_original, predictions_data):
+    """Desenha as detecções na imagem original e salva em UPLOAD_FOLDER"""
+    # Calcular fator de escala (original / processada)
+    img_original_height, img_original_width = imagem_original.shape[:2]
+    # A imagem processada tem 640x640
+    scale_x = img_original_width / 640.0
+    scale_y = img_original_height / 640.0
+    
+    # Salvar imagem com detecções (aplicando escala correta)
+    print(f"\n📊 Resultados: {len(predictions_data)} detecções encontradas")
+    imagem_com_deteccoes = drawDetections(
+        imagem_original.copy(), 
+        predictions_data,
+        scale_x=scale_x,
+        scale_y=scale_y
+    )
+    
+    nome_arquivo_resultado = f"resultado_{os.path.basename(image_path)}"
+    caminho_resultado = os.path.join(UPLOAD_FOLDER, nome_arquivo_resultado)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    cv2.imwrite(caminho_resultado, imagem_com_deteccoes)
+    print(f"✅ Imagem salva: {caminho_resultado}")
+    return nome_arquivo_resultado
+
+def precisaGemini(analise, resumo_ia=False):
+    """O Gemini só é chamado se as regras forem inconclusivas ou se o resumo for pedido"""
+    return resumo_ia or not analise['conclusiva']
+
+def combinarAnalise(analise, resposta_gemini):
+    """
+    Escolhe a mensagem e o JSON finais entre a resposta do Gemini e a análise local.
+
+    Returns:
+        tuple: (mensagem_ia, dados_json, origem) - origem é 'gemini' ou 'regras'
+    """
+    if resposta_gemini:
+        mensagem_ia, dados_estruturados = interpretarRespostaGemini(resposta_gemini)
+        if mensagem_ia or dados_estruturados:
+            # Se o Gemini não devolveu um JSON válido, os dados das regras preenchem o dashboard
+            return mensagem_ia, dados_estruturados or analise['dados_json'], 'gemini'
+    
+    return analise['mensagem_ia'], analise['dados_json'], 'regras'
+
+def montarResultado(image_path, nome_arquivo_resultado, relatorio, analise, resposta_gemini,
+                    detected_objects, inference_time_ms):
+    """Monta o dicionário de resultado de uma imagem processada com sucesso"""
+    mensagem_ia, dados_estruturados, origem = combinarAnalise(analise, resposta_gemini)
+    
+    return {
+        'sucesso': True,
+        'imagem_original': os.path.basename(image_path),
+        'imagem_resultado': nome_arquivo_resultado,
+        'relatorio_bruto': relatorio,
+        'mensagem_ia': mensagem_ia,
+        'dados_json': dados_estruturados,
+        'origem_analise': origem,
+        'total_objetos': len(detected_objects),
+        'tempo_ms': round(inference_time_ms, 2),
+        'deteccoes': detected_objects
+    }
+
+def resultadoErro(image_path, erro):
+    return {
+        'sucesso': False,
+        'imagem_original': os.path.basename(image_path),
+        'erro': str(erro)
+    }
+
+def processSingleImage(image_path, resumo_ia=False):
+    """Processa uma única imagem e retorna os dados estruturados (um lote de uma imagem, ver processImages).
+
+    Args:
+        image_path (str): Caminho da imagem
+        resumo_ia (bool): Pede o resumo em linguagem natural ao Gemini mesmo
+            quando as regras locais são suficientes
+    """
+    return processImages([image_path], resumo_ia)[0]
+
+def getClientes():
+    """Retorna os clientes assíncronos do detector e do Gemini (criados uma única vez)"""
+    global clientes
+    if clientes is None:
+        with _clientes_lock:
+            if clientes is None:
+                clientes = ClientesAsync.doAmbiente()
+                atexit.register(clientes.fechar)
+    return clientes
+
+def executorOnnx(indice):
+    """
+    Executor dedicado à instância ONNX da vaga `indice`, com MODEL_MAX_IN_FLIGHT threads.
+
+    A inferência local não disputa o executor padrão do loop (usado pelo
+    pré-processamento) e cada instância roda no máximo MODEL_MAX_IN_FLIGHT
+    predições ao mesmo tempo.
+    """
+    if indice not in _executores_onnx:
+        with _executores_lock:
+            if indice not in _executores_onnx:
+                _executores_onnx[indice] = ThreadPoolExecutor(
+                    max_workers=MODEL_MAX_IN_FLIGHT, thread_name_prefix=f"onnx-{indice}"
+                )
+    return _executores_onnx[indice]
+
+def inferirLocal(indice, imagem_bytes):
+    """Inferência síncrona na instância ONNX da vaga `indice` (roda no executorOnnx)"""
+    model = getPool().instancia(indice)
+    return model.predict(imagem_bytes, confidence=CONFIDENCE_THRESHOLD, overlap=OVERLAP_THRESHOLD).json()
+
+async def detectarBytes(imagem_bytes, clientes, indice_modelo=None):
+    """
+    Envia uma imagem já pré-processada (JPEG em memória) ao detector e retorna o JSON da predição.
+
+    Args:
+        indice_modelo (int): Vaga do pool reservada para o lote; só é usada pelo
+            modelo local. No detector hospedado a concorrência e a cota ficam a
+            cargo do semáforo e do token bucket do cliente.
+    """
+    if MODELO_ONNX:
+        # Modelo local: a inferência roda na CPU, no executor da instância da vaga do lote
+        return await asyncio.get_running_loop().run_in_executor(
+            executorOnnx(indice_modelo), inferirLocal, indice_modelo, imagem_bytes
+        )
+    
+    return await clientes.detector.predict(
+        imagem_bytes,
+        confidence=CONFIDENCE_THRESHOLD,
+        overlap=OVERLAP_THRESHOLD
+    )
+
+async def emThread(funcao, *args):
+    """
+    Como asyncio.to_thread, mas um cancelamento só termina a tarefa depois que
+    a thread acabou: quem cancela e espera (cancelarImagens) pode apagar os
+    arquivos sem que a thread ainda esteja lendo ou gravando neles.
+    """
+    futuro = asyncio.ensure_future(asyncio.to_thread(funcao, *args))
+    try:
+        return await asyncio.shield(futuro)
+    except asyncio.CancelledError:
+        # A thread não para no meio: espera ela acabar e descarta o resultado
+        await asyncio.wait({futuro})
+        if not futuro.cancelled():
+            futuro.exception()
+        raise
+
+async def processSingleImageAsync(image_path, clientes, resumo_ia=False, indice_modelo=None):
+    """
+    Versão assíncrona de processSingleImage: o trabalho de CPU (OpenCV) roda em
+    threads e as chamadas ao detector e ao Gemini usam os clientes do loop,
+    então várias imagens ficam em voo ao mesmo tempo.
+
+    A vaga do pool (`indice_modelo`) é reservada uma vez pelo lote, não por imagem.
+    """
+    try:
+        imagem_bytes, imagem_original = await emThread(preProcessImageBytes, image_path)
         
-        if not object_counts:
-            relatorio += "⚪ Nenhum objeto das classes conhecidas foi detectado.\n"
-        else:
-            relatorio += "📋 Resumo por Classe:\n"
-            for obj, count in object_counts.items():
-                relatorio += f"- {obj}: {count} unidade(s)\n"
-        
-        if detected_objects:
-            relatorio += "-" * 50 + "\n"
-            relatorio += "🔍 Detalhes Individuais:\n"
-            for i, obj in enumerate(detected_objects, 1):
-                relatorio += f" ➡️ Objeto #{i}:\n"
-                relatorio += f" - Classe: {obj['classe']}\n"
-                relatorio += f" - Confiança: {obj['confianca']:.2%}\n"
-        
-        relatorio += "=" * 50 + "\n"
-        
-        # Processar com Gemini
-        resposta_gemini = runChat(relatorio)
-        
-        # Extrair JSON da resposta
-        dados_estruturados = None
-        mensagem_ia = ""
+        prediction_data = await detectarBytes(imagem_bytes, clientes, indice_modelo)
         
-        if resposta_gemini:
-            try:
-                # Separar mensagem e JSON
-                if "**MENSAGEM:**" in resposta_gemini:
-                    partes = resposta_gemini.split("**JSON:**")
-                    mensagem_ia = partes[0].replace("**MENSAGEM:**", "").strip()
-                    if len(partes) > 1:
-                        json_str = partes[1].strip()
-                        # Remove marcadores de código se existirem
-                        json_str = json_str.replace("```json", "").replace("```", "").strip()
-                        dados_estruturados = json.loads(json_str)
-                elif "```json" in resposta_gemini:
-                    inicio_json = resposta_gemini.find("```json") + 7
-                    fim_json = resposta_gemini.find("```", inicio_json)
-                    json_str = resposta_gemini[inicio_json:fim_json].strip()
-                    dados_estruturados = json.loads(json_str)
-                    mensagem_ia = resposta_gemini[:inicio_json-7].strip()
-            except Exception as e:
-                print(f" Erro ao extrair JSON: {e}")
-                # Tenta extrair apenas a mensagem
-                mensagem_ia = resposta_gemini
+        detected_objects, object_counts, inference_time_ms = extrairDeteccoes(prediction_data)
+        analise = analisarDeteccoes(detected_objects, inference_time_ms)
+        relatorio = montarRelatorio(image_path, detected_objects, object_counts, inference_time_ms)
         
-        # Salvar imagem com detecções (aplicando escala correta)
-        print(f"\n📊 Resultados: {len(predictions_data)} detecções encontradas")
-        imagem_com_deteccoes = drawDetections(
-            imagem_original.copy(), 
-            predictions_data,
-            scale_x=scale_x,
-            scale_y=scale_y
+        # O desenho da imagem de resultado roda em paralelo com a chamada ao Gemini (se houver)
+        salvar = emThread(
+            salvarImagemResultado, image_path, imagem_original, prediction_data.get('predictions', [])
         )
+        if precisaGemini(analise, resumo_ia):
+            resposta_gemini, nome_arquivo_resultado = await asyncio.gather(
+                clientes.gemini.gerar(relatorio), salvar
+            )
+        else:
+            resposta_gemini, nome_arquivo_resultado = None, await salvar
         
-        nome_arquivo_resultado = f"resultado_{os.path.basename(image_path)}"
-        caminho_resultado = os.path.join('uploads', nome_arquivo_resultado)
-        cv2.imwrite(caminho_resultado, imagem_com_deteccoes)
-        print(f"✅ Imagem salva: {caminho_resultado}")
-        
-        return {
-            'sucesso': True,
-            'imagem_original': os.path.basename(image_path),
-            'imagem_resultado': nome_arquivo_resultado,
-            'relatorio_bruto': relatorio,
-            'mensagem_ia': mensagem_ia,
-            'dados_json': dados_estruturados,
-            'total_objetos': len(detected_objects),
-            'tempo_ms': round(inference_time_ms, 2),
-            'deteccoes': detected_objects
-        }
+        return montarResultado(image_path, nome_arquivo_resultado, relatorio, analise, resposta_gemini,
+                               detected_objects, inference_time_ms)
         
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"Erro no processamento da imagem: {e}")
-        return {
-            'sucesso': False,
-            'imagem_original': os.path.basename(image_path),
-            'erro': str(e)
-        }
-    finally:
-        # Limpa arquivo temporário se existir
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-
-def processImages(list_paths):
-    """Processa múltiplas imagens e retorna lista de resultados"""
-    resultados = []
-    
+        return resultadoErro(image_path, e)
+
+def registrarResultado(i, total, caminho, resultado):
+    print(f" Imagem {i}/{total}: {os.path.basename(caminho)}")
+    if resultado['sucesso']:
+        print(f"    Sucesso - {resultado['total_objetos']} objetos detectados")
+    else:
+        print(f"    Erro: {resultado['erro']}")
+
+def processImages(list_paths, resumo_ia=False):
+    """
+    Processa múltiplas imagens em paralelo e retorna lista de resultados.
+
+    Mesmo caminho do /upload: o lote reserva uma única vaga do pool (ou lança
+    PoolSaturadoError) e as imagens são despachadas no loop dos clientes.
+    """
     print(f"\n Processando {len(list_paths)} imagem(ns)...\n")
     
-    for i, caminho in enumerate(list_paths, 1):
-        if not os.path.exists(caminho):
-            print(f" Arquivo não encontrado: {caminho}")
-            resultados.append({
-                'sucesso': False,
-                'imagem_original': os.path.basename(caminho),
-                'erro': 'Arquivo não encontrado'
-            })
-            continue
-            
-        print(f" Processando imagem {i}/{len(list_paths)}: {os.path.basename(caminho)}")
-        resultado = processSingleImage(caminho)
-        resultados.append(resultado)
-        
-        if resultado['sucesso']:
-            print(f"    Sucesso - {resultado['total_objetos']} objetos detectados")
-        else:
-            print(f"    Erro: {resultado['erro']}")
+    with getPool().vaga() as indice_modelo:
+        despachadas = [(caminho, despacharImagem(caminho, resumo_ia, indice_modelo)) for caminho in list_paths]
+        resultados = coletarImagens(despachadas)
     
     print(f"\n Processamento concluído!\n")
     return resultados
 
-"""
-# Para testar localmente (sem Flask)
+def despacharImagem(image_path, resumo_ia=False, indice_modelo=None):
+    """
+    Agenda o processamento de uma imagem no loop dos clientes e retorna na hora.
+
+    Usado pelo upload em streaming: cada imagem começa a ser processada assim
+    que termina de chegar, enquanto o resto da requisição ainda está sendo lido.
+    Quem chama reserva a vaga do pool uma vez por lote e a passa em
+    `indice_modelo` (o /upload com getPool().reservar() ao receber o primeiro
+    arquivo válido; processImages com getPool().vaga()).
+
+    Returns:
+        concurrent.futures.Future: resultado de processSingleImageAsync
+    """
+    clientes = getClientes()
+    tarefa = []     # Preenchida pela própria tarefa no loop (usada por cancelarImagens)
+    futuro = asyncio.run_coroutine_threadsafe(
+        _acompanharTarefa(tarefa, image_path, clientes, resumo_ia, indice_modelo), clientes.loop
+    )
+    futuro.tarefa = tarefa
+    return futuro
+
+async def _acompanharTarefa(tarefa, *args):
+    """Registra a tarefa asyncio da imagem antes de processá-la"""
+    tarefa.append(asyncio.current_task())
+    return await processSingleImageAsync(*args)
+
+def cancelarImagens(despachadas):
+    """
+    Cancela as imagens agendadas por despacharImagem e só retorna quando todas
+    pararam de fato (inclusive o trabalho que já estava em threads). Depois
+    disso os arquivos do lote podem ser apagados.
+
+    Args:
+        despachadas (list): Pares (caminho, future)
+    """
+    if not despachadas:
+        return
+    for _, futuro in despachadas:
+        futuro.cancel()
+
+    async def esperar():
+        # Os cancelamentos e a criação das tarefas entraram no loop antes desta
+        # corrotina: uma tarefa que não se registrou foi cancelada antes de começar
+        tarefas = [t for _, futuro in despachadas for t in futuro.tarefa]
+        if tarefas:
+            await asyncio.wait(tarefas)
+
+    getClientes().executar(esperar())
+
+def coletarImagens(despachadas):
+    """
+    Espera as imagens agendadas por despacharImagem, na ordem em que foram enviadas.
+
+    Args:
+        despachadas (list): Pares (caminho, future)
+
+    Returns:
+        list: Resultados na mesma ordem
+    """
+    resultados = []
+    for i, (caminho, futuro) in enumerate(despachadas, 1):
+        resultado = futuro.result()
+        registrarResultado(i, len(despachadas), caminho, resultado)
+        resultados.append(resultado)
+    return resultados
+
+def assinaturaModelo():
+    """
+    Identifica o modelo e os limiares em uso. Um resultado guardado no histórico
+    só é reaproveitado para uma imagem idêntica se a assinatura for a mesma.
+    """
+    if MODELO_ONNX:
+        # A data de modificação muda quando o ONNX é reexportado no mesmo caminho
+        origem = f"onnx:{os.path.abspath(MODELO_ONNX)}@{int(os.path.getmtime(MODELO_ONNX))}"
+    else:
+        origem = f"roboflow:{ROBOFLOW_WORKSPACE}/{ROBOFLOW_PROJECT}/{ROBOFLOW_VERSION}"
+    return f"{origem}|confidence={CONFIDENCE_THRESHOLD}|overlap={OVERLAP_THRESHOLD}"
+
+# Para testar localmente (sem Flask): python predictDetector.py
 if __name__ == "__main__":
-    # Teste básico do modelo
-    try:
-        model = loadModel()
-        print(" Conexão com Roboflow estabelecida com sucesso!")
-    except Exception as e:
-        print(f" Erro na conexão com Roboflow: {e}")
-        exit(1)
-    
     # Teste com imagem
-    caminho_imagem_teste = os.path.join('uploads', 'alicate.jpeg')
+    caminho_imagem_teste = os.path.join(UPLOAD_FOLDER, 'alicate.jpeg')
     
     if not os.path.exists(caminho_imagem_teste):
         print(f" Imagem de teste não encontrada: {caminho_imagem_teste}")
@@ -361,4 +603,3 @@ if __name__ == "__main__":
                     print(json.dumps(resultado['dados_json'], indent=2, ensure_ascii=False))
             else:
                 print(f"Erro: {resultado['erro']}")
-"""
\ No newline at end of file
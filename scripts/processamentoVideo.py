@@ -0,0 +1,332 @@
+import asyncio
+import os
+import time
+import cv2
+from collections import Counter, deque
+from preProcessingImages import preprocess_image
+from regrasInferencia import analisarDeteccoes
+from predictDetector import (
+    getPool, getClientes, detectarBytes, extrairDeteccoes, montarRelatorio, precisaGemini,
+    salvarImagemResultado, montarResultado, resultadoErro
+)
+
+"""
+PROCESSAMENTO DE VÍDEOS (CAMINHADAS PELA OBRA)
+
+O vídeo é decodificado quadro a quadro com o OpenCV, mas só os quadros-chave
+passam pelo preprocess_image e pelo detector:
+
+- Amostragem 'cena': novo quadro-chave quando o histograma muda além do
+  limiar (mudança de cena) ou depois de VIDEO_MAX_INTERVALO quadros
+- Amostragem 'fixo': um quadro-chave a cada VIDEO_PASSO quadros
+
+Os quadros intermediários não são rastreados: a cada quadro-chave, as
+detecções são associadas às trilhas existentes pela posição prevista (IoU com
+velocidade constante). Cada trilha é contada uma única vez, e um único resumo
+(regras ou Gemini) cobre o vídeo inteiro.
+
+Na amostragem 'cena' cada cena costuma gerar um único quadro-chave, então um
+objeto visto uma vez já conta; VIDEO_MIN_HITS (confirmação em vários
+quadros-chave, contra detecções espúrias) vale só para a amostragem 'fixo'.
+"""
+
+VIDEO_MODO_AMOSTRAGEM = os.getenv("VIDEO_MODO_AMOSTRAGEM", "cena")  # 'cena' ou 'fixo'
+VIDEO_PASSO = int(os.getenv("VIDEO_PASSO", 15))                     # Passo da amostragem fixa
+VIDEO_LIMIAR_CENA = float(os.getenv("VIDEO_LIMIAR_CENA", 0.3))      # Distância de Bhattacharyya (0-1)
+VIDEO_MAX_INTERVALO = int(os.getenv("VIDEO_MAX_INTERVALO", 90))     # Máximo de quadros sem inferência
+VIDEO_MIN_HITS = int(os.getenv("VIDEO_MIN_HITS", 2))                # Quadros-chave para confirmar um objeto ('fixo')
+VIDEO_MAX_PENDENTES = max(1, int(os.getenv("VIDEO_MAX_PENDENTES", 8)))  # Quadros-chave aguardando o detector
+MODOS_AMOSTRAGEM = ('cena', 'fixo')
+
+# Rastreador
+LIMIAR_IOU = 0.3      # IoU mínimo entre a caixa prevista e a detecção
+MAX_PERDIDO = 3       # Quadros-chave sem ver o objeto antes de encerrar a trilha
+
+
+def histogramaQuadro(quadro):
+    """Histograma de tons de cinza (quadro reduzido) usado na detecção de mudança de cena"""
+    pequeno = cv2.resize(quadro, (160, 90), interpolation=cv2.INTER_AREA)
+    cinza = cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([cinza], [0], None, [64], [0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def amostrarQuadros(caminho, modo=VIDEO_MODO_AMOSTRAGEM, passo=VIDEO_PASSO,
+                    limiar_cena=VIDEO_LIMIAR_CENA, max_intervalo=VIDEO_MAX_INTERVALO):
+    """
+    Decodifica o vídeo e indica quais quadros são quadros-chave.
+
+    Yields:
+        tuple: (indice_quadro, quadro, eh_quadro_chave)
+    """
+    captura = cv2.VideoCapture(caminho)
+    if not captura.isOpened():
+        raise ValueError(f"Não foi possível abrir o vídeo: {caminho}")
+
+    try:
+        indice = 0
+        ultimo_chave = None
+        hist_chave = None
+        while True:
+            ok, quadro = captura.read()
+            if not ok:
+                break
+
+            hist = histogramaQuadro(quadro) if modo != 'fixo' else None
+
+            if ultimo_chave is None:
+                chave = True
+            elif modo == 'fixo':
+                chave = indice - ultimo_chave >= passo
+            else:
+                # Compara com o último quadro-chave: mudanças lentas também acumulam
+                distancia = cv2.compareHist(hist_chave, hist, cv2.HISTCMP_BHATTACHARYYA)
+                chave = distancia > limiar_cena or indice - ultimo_chave >= max_intervalo
+
+            if chave:
+                ultimo_chave = indice
+                hist_chave = hist
+
+            yield indice, quadro, chave
+            indice += 1
+    finally:
+        captura.release()
+
+
+def iou(a, b):
+    """Intersecção sobre união de duas caixas (x1, y1, x2, y2)"""
+    largura = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    altura = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = largura * altura
+    uniao = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / uniao if uniao > 0 else 0.0
+
+
+class RastreadorIoU:
+    """
+    Rastreador leve de objetos entre quadros-chave.
+
+    Cada trilha guarda a última caixa e a velocidade (pixels por quadro); a
+    posição num quadro intermediário é prevista por velocidade constante.
+    Detecções do quadro-chave são associadas às trilhas da mesma classe pelo
+    maior IoU com a caixa prevista.
+    """
+
+    def __init__(self, limiar_iou=LIMIAR_IOU, max_perdido=MAX_PERDIDO):
+        self.limiar_iou = limiar_iou
+        self.max_perdido = max_perdido
+        self.ativas = []
+        self.encerradas = []
+        self._proximo_id = 1
+
+    @staticmethod
+    def caixaPrevista(trilha, quadro):
+        """Leva a caixa da trilha até o `quadro` usando a velocidade estimada"""
+        dt = quadro - trilha['ultimo_quadro']
+        vx, vy = trilha['velocidade']
+        x1, y1, x2, y2 = trilha['caixa']
+        return (x1 + vx * dt, y1 + vy * dt, x2 + vx * dt, y2 + vy * dt)
+
+    def atualizar(self, quadro, deteccoes):
+        """Associa as detecções de um quadro-chave às trilhas existentes"""
+        candidatos = []
+        for i, trilha in enumerate(self.ativas):
+            prevista = self.caixaPrevista(trilha, quadro)
+            for j, det in enumerate(deteccoes):
+                if det['classe'] == trilha['classe']:
+                    valor = iou(prevista, det['caixa'])
+                    if valor >= self.limiar_iou:
+                        candidatos.append((valor, i, j))
+
+        trilhas_usadas, deteccoes_usadas = set(), set()
+        for _, i, j in sorted(candidatos, reverse=True):
+            if i in trilhas_usadas or j in deteccoes_usadas:
+                continue
+            trilhas_usadas.add(i)
+            deteccoes_usadas.add(j)
+
+            trilha, det = self.ativas[i], deteccoes[j]
+            dt = max(1, quadro - trilha['ultimo_quadro'])
+            cx_antigo = (trilha['caixa'][0] + trilha['caixa'][2]) / 2
+            cy_antigo = (trilha['caixa'][1] + trilha['caixa'][3]) / 2
+            cx_novo = (det['caixa'][0] + det['caixa'][2]) / 2
+            cy_novo = (det['caixa'][1] + det['caixa'][3]) / 2
+            trilha['velocidade'] = ((cx_novo - cx_antigo) / dt, (cy_novo - cy_antigo) / dt)
+            trilha['caixa'] = det['caixa']
+            trilha['ultimo_quadro'] = quadro
+            trilha['hits'] += 1
+            trilha['perdido'] = 0
+            trilha['confianca'] = max(trilha['confianca'], det['confianca'])
+
+        for j, det in enumerate(deteccoes):
+            if j not in deteccoes_usadas:
+                self.ativas.append({
+                    'id': self._proximo_id,
+                    'classe': det['classe'],
+                    'caixa': det['caixa'],
+                    'velocidade': (0.0, 0.0),
+                    'ultimo_quadro': quadro,
+                    'primeiro_quadro': quadro,
+                    'hits': 1,
+                    'perdido': 0,
+                    'confianca': det['confianca'],
+                })
+                self._proximo_id += 1
+
+        # Trilhas não vistas por muitos quadros-chave são encerradas
+        ainda_ativas = []
+        for trilha in self.ativas:
+            if trilha['ultimo_quadro'] != quadro:
+                trilha['perdido'] += 1
+            if trilha['perdido'] > self.max_perdido:
+                self.encerradas.append(trilha)
+            else:
+                ainda_ativas.append(trilha)
+        self.ativas = ainda_ativas
+
+    def trilhasConfirmadas(self, min_hits):
+        """Trilhas vistas em pelo menos `min_hits` quadros-chave (objetos únicos do vídeo)"""
+        return [t for t in self.encerradas + self.ativas if t['hits'] >= min_hits]
+
+
+def paraCaixa(obj):
+    """Converte centro + largura/altura (formato do detector) em (x1, y1, x2, y2)"""
+    return (obj['x'] - obj['width'] / 2, obj['y'] - obj['height'] / 2,
+            obj['x'] + obj['width'] / 2, obj['y'] + obj['height'] / 2)
+
+
+def trilhaParaObjeto(trilha):
+    """Converte uma trilha para o formato de detected_objects (usado pelas regras e pelo histórico)"""
+    x1, y1, x2, y2 = trilha['caixa']
+    return {
+        "classe": trilha['classe'],
+        "confianca": float(trilha['confianca']),
+        "x": (x1 + x2) / 2,
+        "y": (y1 + y2) / 2,
+        "width": x2 - x1,
+        "height": y2 - y1,
+        "trilha_id": trilha['id'],
+        "primeiro_quadro": trilha['primeiro_quadro'],
+        "ultimo_quadro": trilha['ultimo_quadro'],
+    }
+
+
+def codificarQuadroChave(quadro):
+    """Aplica o pré-processamento no quadro-chave e o codifica em JPEG na memória"""
+    processado = preprocess_image(quadro)
+    ok, buffer = cv2.imencode('.jpg', processado)
+    if not ok:
+        raise ValueError("Não foi possível codificar o quadro")
+    return buffer.tobytes()
+
+
+def processVideo(video_path, resumo_ia=False, modo=VIDEO_MODO_AMOSTRAGEM, indice_modelo=None):
+    """
+    Processa um vídeo e retorna um único resultado, no mesmo formato das imagens.
+
+    Args:
+        video_path (str): Caminho do vídeo
+        resumo_ia (bool): Pede o resumo do Gemini mesmo se as regras bastarem
+        modo (str): Amostragem dos quadros-chave ('cena' ou 'fixo')
+        indice_modelo (int): Vaga do pool já reservada pelo upload; sem ela o
+            vídeo reserva a própria (e PoolSaturadoError sobe para quem chamou)
+    """
+    if modo not in MODOS_AMOSTRAGEM:
+        raise ValueError(f"Modo de amostragem inválido: {modo} (use 'cena' ou 'fixo')")
+    
+    if indice_modelo is None:
+        with getPool().vaga() as indice:
+            return processVideo(video_path, resumo_ia, modo, indice)
+    
+    inicio = time.perf_counter()
+    clientes = getClientes()
+    pendentes = deque()
+    rastreador = RastreadorIoU()
+    estado = {'tempo_inferencia_ms': 0.0, 'melhor_quadro': None, 'melhor_total': -1}
+
+    def consumir():
+        """Passa o quadro-chave mais antigo pelo rastreador (na ordem do vídeo)"""
+        indice, quadro, futuro = pendentes.popleft()
+        prediction_data = futuro.result()
+        detected_objects, _, inference_time_ms = extrairDeteccoes(prediction_data)
+        estado['tempo_inferencia_ms'] += inference_time_ms
+        rastreador.atualizar(indice, [
+            {'classe': o['classe'], 'confianca': o['confianca'], 'caixa': paraCaixa(o)}
+            for o in detected_objects
+        ])
+        # O quadro com mais detecções ilustra o resultado
+        if len(detected_objects) > estado['melhor_total']:
+            estado['melhor_total'] = len(detected_objects)
+            estado['melhor_quadro'] = (quadro, prediction_data.get('predictions', []))
+
+    try:
+        print(f"🎬 Processando vídeo: {os.path.basename(video_path)} (amostragem: {modo})")
+        captura = cv2.VideoCapture(video_path)
+        fps_video = captura.get(cv2.CAP_PROP_FPS) or 0.0
+        captura.release()
+
+        # Os quadros-chave vão ao detector assim que decodificados e as chamadas
+        # rodam em paralelo no loop dos clientes enquanto o vídeo continua sendo lido.
+        # Só os quadros ainda aguardando resposta ficam em memória: com
+        # VIDEO_MAX_PENDENTES em voo a leitura espera o mais antigo (contrapressão).
+        total_quadros = 0
+        quadros_inferidos = 0
+        for indice, quadro, chave in amostrarQuadros(video_path, modo=modo):
+            total_quadros += 1
+            if not chave:
+                continue
+            imagem_bytes = codificarQuadroChave(quadro)
+            futuro = asyncio.run_coroutine_threadsafe(detectarBytes(imagem_bytes, clientes, indice_modelo),
+                                                     clientes.loop)
+            pendentes.append((indice, quadro, futuro))
+            quadros_inferidos += 1
+
+            while pendentes and (pendentes[0][2].done() or len(pendentes) > VIDEO_MAX_PENDENTES):
+                consumir()
+
+        while pendentes:
+            consumir()
+
+        if total_quadros == 0:
+            raise ValueError("O vídeo não contém quadros legíveis")
+
+        tempo_inferencia_ms = estado['tempo_inferencia_ms']
+        # Na amostragem por cena um objeto de uma cena curta aparece num único quadro-chave
+        min_hits = 1 if modo == 'cena' else min(VIDEO_MIN_HITS, quadros_inferidos)
+        objetos_unicos = [trilhaParaObjeto(t) for t in rastreador.trilhasConfirmadas(min_hits)]
+        contagem = Counter(o['classe'] for o in objetos_unicos)
+
+        # Um único resumo para o vídeo inteiro
+        analise = analisarDeteccoes(objetos_unicos, tempo_inferencia_ms)
+        relatorio = montarRelatorio(video_path, objetos_unicos, contagem, tempo_inferencia_ms)
+        resposta_gemini = None
+        if precisaGemini(analise, resumo_ia):
+            resposta_gemini = clientes.executar(clientes.gemini.gerar(relatorio))
+
+        nome_base = os.path.splitext(os.path.basename(video_path))[0] + '.jpg'
+        melhor_quadro, melhores_predicoes = estado['melhor_quadro']
+        nome_arquivo_resultado = salvarImagemResultado(nome_base, melhor_quadro, melhores_predicoes)
+
+        resultado = montarResultado(video_path, nome_arquivo_resultado, relatorio, analise, resposta_gemini,
+                                    objetos_unicos, tempo_inferencia_ms)
+
+        tempo_total = time.perf_counter() - inicio
+        resultado['tipo'] = 'video'
+        resultado['metricas_video'] = {
+            'modo_amostragem': modo,
+            'total_quadros': total_quadros,
+            'quadros_inferidos': quadros_inferidos,
+            'fracao_inferida': round(quadros_inferidos / total_quadros, 4),
+            'fps_video': round(fps_video, 2),
+            'fps_processamento': round(total_quadros / tempo_total, 2) if tempo_total > 0 else 0.0,
+            'tempo_processamento_s': round(tempo_total, 2),
+        }
+        print(f"✅ Vídeo processado: {quadros_inferidos}/{total_quadros} quadros inferidos, "
+              f"{len(objetos_unicos)} objeto(s) único(s), {resultado['metricas_video']['fps_processamento']} fps")
+        return resultado
+
+    except Exception as e:
+        for _, _, futuro in pendentes:
+            futuro.cancel()
+        print(f"Erro no processamento do vídeo: {e}")
+        return resultadoErro(video_path, e)
@@ -0,0 +1,266 @@
+import unicodedata
+from collections import Counter
+
+"""
+MOTOR DE REGRAS PARA INFERÊNCIA DE FERRAMENTAS
+
+Implementação local da base de conhecimento do prompt.md: tradução das
+classes do detector para português e inferência de ferramentas completas a
+partir das partes detectadas (ex.: Cabeça metálica + Cabo -> Martelo).
+
+Gera o mesmo `dados_json` que o Gemini devolveria e uma `mensagem_ia` por
+template. Quando as regras não bastam (classe desconhecida ou componente
+sem par), a análise é marcada como inconclusiva e o Gemini é chamado.
+"""
+
+# ===================================================================
+# TRADUÇÃO DAS CLASSES
+# ===================================================================
+# classe normalizada -> (tipo_especifico, categoria_geral, papel do componente)
+# Papel None indica um objeto completo (não participa das inferências)
+CLASSES = {
+    # Ferramentas completas (termos do prompt.md)
+    'plier': ('Alicate Universal', 'Alicate', None),
+    'pliers': ('Alicate Universal', 'Alicate', None),
+    'combination': ('Alicate de Combinação', 'Alicate', None),
+    'slip joint': ('Alicate de Pressão', 'Alicate', None),
+    'screwdriver': ('Chave de Fenda', 'Ferramenta Manual', None),
+    'phillips': ('Chave Philips', 'Ferramenta Manual', None),
+    'hammer': ('Martelo', 'Ferramenta Manual', None),
+    'wrench': ('Chave Inglesa', 'Ferramenta Manual', None),
+    'saw': ('Serrote', 'Ferramenta Manual', None),
+    'tape measure': ('Trena', 'Instrumento de Medição', None),
+
+    # Ferramentas completas (classes treinadas no modelo)
+    'alicate de ferro': ('Alicate de Ferro', 'Alicate', None),
+    'chave de fenda': ('Chave de Fenda', 'Ferramenta Manual', None),
+    'espatula de ferro': ('Espátula de Ferro', 'Ferramenta Manual', None),
+    'martelo de borracha': ('Martelo de Borracha', 'Ferramenta Manual', None),
+    'martelo de ferro': ('Martelo de Ferro', 'Ferramenta Manual', None),
+    'pa de ferro': ('Pá de Ferro', 'Ferramenta de Construção', None),
+
+    # Componentes
+    'handle': ('Cabo/Empunhadura', 'Componente', 'cabo'),
+    'grip': ('Empunhadura', 'Componente', 'cabo'),
+    'cabo de borracha': ('Cabo de Borracha', 'Componente', 'cabo'),
+    'cabo de madeira': ('Cabo de Madeira', 'Componente', 'cabo'),
+    'empunhadura de borracha': ('Empunhadura de Borracha', 'Componente', 'cabo'),
+    'empunhadura de plastico': ('Empunhadura de Plástico', 'Componente', 'cabo'),
+    'punho de borracha': ('Punho de Borracha', 'Componente', 'cabo'),
+    'punho de madeira': ('Punho de Madeira', 'Componente', 'cabo'),
+    'haste de borracha': ('Haste de Borracha', 'Componente', 'cabo'),
+    'bastao de madeira': ('Bastão de Madeira', 'Componente', 'cabo'),
+    'shaft': ('Haste', 'Componente', 'haste'),
+    'metal shaft': ('Haste Metálica', 'Componente', 'haste'),
+    'haste de metal': ('Haste de Metal', 'Componente', 'haste'),
+    'bastao de ferro': ('Bastão de Ferro', 'Componente', 'haste'),
+    'tip': ('Ponta', 'Componente', 'ponta'),
+    'metal head': ('Cabeça Metálica', 'Componente', 'cabeca'),
+    'head': ('Cabeça Metálica', 'Componente', 'cabeca'),
+    'jaw': ('Mandíbula', 'Componente', 'mandibula'),
+    'pivot': ('Articulação', 'Componente', 'articulacao'),
+    'adjustable jaw': ('Mandíbula Móvel', 'Componente', 'mandibula_movel'),
+    'adjustment screw': ('Parafuso de Ajuste', 'Componente', 'parafuso_ajuste'),
+    'metal body': ('Corpo Metálico', 'Componente', 'corpo_metalico'),
+    'blade': ('Lâmina Dentada', 'Componente', 'lamina_dentada'),
+    'toothed blade': ('Lâmina Dentada', 'Componente', 'lamina_dentada'),
+    'case': ('Caixa da Trena', 'Componente', 'caixa'),
+    'measuring tape': ('Fita Métrica', 'Componente', 'fita'),
+}
+
+# ===================================================================
+# COMPOSIÇÃO DE FERRAMENTAS (seção "BASE DE CONHECIMENTO" do prompt.md)
+# ===================================================================
+# ferramenta inferida -> combinações de papéis que a compõem
+REGRAS = [
+    ('Chave de Fenda', [('cabo', 'haste'), ('cabo', 'ponta')]),
+    ('Martelo', [('cabeca', 'cabo')]),
+    ('Alicate', [('mandibula', 'cabo'), ('articulacao', 'cabo')]),
+    ('Chave Inglesa', [('corpo_metalico', 'mandibula_movel'), ('parafuso_ajuste', 'cabo')]),
+    ('Serrote', [('lamina_dentada', 'cabo')]),
+    ('Trena', [('caixa', 'fita')]),
+]
+
+# Duas caixas são vizinhas se a distância entre elas for no máximo esta
+# fração do maior lado da caixa menor (0 = precisam se tocar)
+FATOR_ADJACENCIA = 0.25
+
+# Fração da área de um componente dentro de uma ferramenta completa para
+# considerar que ele é parte dela (e não de outra ferramenta)
+FATOR_CONTIDO = 0.6
+
+# Faixa de confiança das inferências com 2+ componentes (prompt.md: 85-95%)
+CONFIANCA_INFERENCIA_MIN = 85.0
+CONFIANCA_INFERENCIA_MAX = 95.0
+
+
+def normalizarClasse(nome):
+    """'Metal-Shaft' -> 'metal shaft', 'Pá_de_Ferro' -> 'pa de ferro'"""
+    sem_acento = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sem_acento.lower().replace('-', ' ').replace('_', ' ').split())
+
+
+def caixa(obj):
+    """Converte centro + largura/altura (formato do Roboflow) em (x1, y1, x2, y2)"""
+    return (obj['x'] - obj['width'] / 2, obj['y'] - obj['height'] / 2,
+            obj['x'] + obj['width'] / 2, obj['y'] + obj['height'] / 2)
+
+
+def distanciaCaixas(a, b):
+    """Menor distância entre as bordas de duas caixas (0 se elas se tocam ou sobrepõem)"""
+    dx = max(0.0, max(a[0], b[0]) - min(a[2], b[2]))
+    dy = max(0.0, max(a[1], b[1]) - min(a[3], b[3]))
+    return (dx ** 2 + dy ** 2) ** 0.5
+
+
+def saoAdjacentes(a, b, fator=FATOR_ADJACENCIA):
+    """Verifica se duas caixas estão próximas o bastante para serem o mesmo objeto"""
+    lado_menor = min(max(a[2] - a[0], a[3] - a[1]), max(b[2] - b[0], b[3] - b[1]))
+    return distanciaCaixas(a, b) <= fator * lado_menor
+
+
+def fracaoContida(interna, externa):
+    """Fração da área de `interna` que está dentro de `externa`"""
+    largura = max(0.0, min(interna[2], externa[2]) - max(interna[0], externa[0]))
+    altura = max(0.0, min(interna[3], externa[3]) - max(interna[1], externa[1]))
+    area = (interna[2] - interna[0]) * (interna[3] - interna[1])
+    return largura * altura / area if area > 0 else 0.0
+
+
+def confiancaInferencia(componentes):
+    """Confiança da inferência (%) a partir da confiança média dos componentes"""
+    media = sum(c['confianca'] for c in componentes) / len(componentes) * 100
+    return round(min(CONFIANCA_INFERENCIA_MAX, max(CONFIANCA_INFERENCIA_MIN, media + 4)), 2)
+
+
+def inferirComposicoes(componentes, ferramentas):
+    """
+    Agrupa componentes vizinhos em ferramentas completas.
+
+    Componentes dentro da caixa de uma ferramenta já detectada pertencem a ela
+    e não geram inferência. Entre os pares candidatos, escolhe primeiro os de
+    maior confiança (guloso), e cada componente é usado uma única vez.
+
+    Returns:
+        tuple: (inferencias, componentes_sem_par)
+    """
+    livres = [c for c in componentes
+              if not any(fracaoContida(c['caixa'], f['caixa']) >= FATOR_CONTIDO for f in ferramentas)]
+
+    candidatos = []
+    for ferramenta, combinacoes in REGRAS:
+        for papel_a, papel_b in combinacoes:
+            for i, a in enumerate(livres):
+                for j, b in enumerate(livres):
+                    if i == j or a['papel'] != papel_a or b['papel'] != papel_b:
+                        continue
+                    if saoAdjacentes(a['caixa'], b['caixa']):
+                        candidatos.append((a['confianca'] + b['confianca'], ferramenta, i, j))
+
+    usados = set()
+    inferencias = []
+    for _, ferramenta, i, j in sorted(candidatos, key=lambda c: c[0], reverse=True):
+        if i in usados or j in usados:
+            continue
+        usados.update((i, j))
+        partes = [livres[i], livres[j]]
+        inferencias.append({
+            'objeto_inferido': ferramenta,
+            'componentes_detectados': [p['tipo_especifico'].lower() for p in partes],
+            'confianca_inferencia': confiancaInferencia(partes),
+            'tipo': 'composicao_partes'
+        })
+
+    sem_par = [c for k, c in enumerate(livres) if k not in usados]
+    return inferencias, sem_par
+
+
+def montarMensagem(objetos, resumo, inferencias):
+    """Gera a mensagem amigável (mesmo tom da MENSAGEM pedida ao Gemini)"""
+    if not objetos:
+        return "Nenhum objeto das classes conhecidas foi detectado na imagem."
+
+    itens = [f"{qtd} {tipo}" for tipo, qtd in resumo.items()]
+    lista = itens[0] if len(itens) == 1 else ", ".join(itens[:-1]) + " e " + itens[-1]
+    media = sum(o['confianca_percentual'] for o in objetos) / len(objetos)
+
+    if len(objetos) == 1:
+        mensagem = f"Foi detectado {lista} com {objetos[0]['confianca_percentual']:.0f}% de confiança."
+    else:
+        mensagem = f"Foram detectados {len(objetos)} objetos: {lista} (confiança média de {media:.0f}%)."
+
+    for inf in inferencias:
+        partes = " e ".join(inf['componentes_detectados'])
+        mensagem += (f" Com base na composição dos componentes ({partes}), identificamos uma ferramenta "
+                     f"completa: {inf['objeto_inferido']} (confiança da inferência: {inf['confianca_inferencia']:.0f}%).")
+    return mensagem
+
+
+def analisarDeteccoes(detected_objects, inference_time_ms=0.0):
+    """
+    Aplica a base de conhecimento sobre os objetos detectados.
+
+    Args:
+        detected_objects (list): Objetos no formato de extrairDeteccoes
+            (classe, confianca 0-1, x, y, width, height)
+        inference_time_ms (float): Tempo de inferência do detector
+
+    Returns:
+        dict: {
+            'conclusiva': bool,      # False -> o Gemini deve ser consultado
+            'motivo': str,           # Por que a análise é inconclusiva (ou None)
+            'mensagem_ia': str,
+            'dados_json': dict       # Mesma estrutura do prompt.md
+        }
+    """
+    objetos = []
+    componentes = []
+    ferramentas = []
+    desconhecidas = []
+
+    for obj in detected_objects:
+        chave = normalizarClasse(obj['classe'])
+        if chave in CLASSES:
+            tipo, categoria, papel = CLASSES[chave]
+        else:
+            # Termo fora do dicionário: o Gemini traduz de forma contextual
+            desconhecidas.append(obj['classe'])
+            tipo, categoria, papel = obj['classe'], 'Desconhecida', None
+
+        objetos.append({
+            'tipo_especifico': tipo,
+            'categoria_geral': categoria,
+            'confianca_percentual': round(obj['confianca'] * 100, 2)
+        })
+
+        item = {'tipo_especifico': tipo, 'papel': papel, 'confianca': obj['confianca'], 'caixa': caixa(obj)}
+        if papel is not None:
+            componentes.append(item)
+        elif chave in CLASSES:
+            ferramentas.append(item)
+
+    inferencias, sem_par = inferirComposicoes(componentes, ferramentas)
+
+    resumo = Counter(o['tipo_especifico'] for o in objetos)
+    dados = {
+        'total_objetos': len(objetos),
+        'tempo_analise_ms': round(inference_time_ms, 2),
+        'confianca_media_percentual': round(
+            sum(o['confianca_percentual'] for o in objetos) / len(objetos), 2) if objetos else 0.0,
+        'resumo_classes': dict(resumo),
+        'objetos_detectados': objetos,
+        'inferencias': inferencias
+    }
+
+    motivo = None
+    if desconhecidas:
+        motivo = f"classes desconhecidas: {', '.join(sorted(set(desconhecidas)))}"
+    elif sem_par:
+        motivo = f"componentes sem par: {', '.join(c['tipo_especifico'] for c in sem_par)}"
+
+    return {
+        'conclusiva': motivo is None,
+        'motivo': motivo,
+        'mensagem_ia': montarMensagem(objetos, resumo, inferencias),
+        'dados_json': dados
+    }
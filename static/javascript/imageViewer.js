@@ -200,6 +200,9 @@ function attachImageListeners() {
         const imagens = document.querySelectorAll('.imagem-box img, .imagem-resultado img');
 
         imagens.forEach(img => {
+            // Evita registrar o listener duas vezes em imagens já preparadas
+            if (img.dataset.visualizador) return;
+            img.dataset.visualizador = '1';
             img.style.cursor = 'pointer';
             img.title = 'Clique para ampliar';
 
@@ -220,4 +223,5 @@ inicializarVisualizadorImagens();
 // Exportar funções globalmente
 window.abrirModal = abrirModal;
 window.fecharModal = fecharModal;
+window.attachImageListeners = attachImageListeners;
 
@@ -25,7 +25,7 @@ uploadArea.addEventListener('drop', (e) => {
     uploadArea.classList.remove('drag-over');
     
     const files = Array.from(e.dataTransfer.files).filter(file => 
-        file.type.startsWith('image/')
+        file.type.startsWith('image/') || file.type.startsWith('video/')
     );
     
     adicionarArquivos(files);
@@ -66,6 +66,19 @@ function atualizarPreview() {
     previewGrid.innerHTML = '';
     
     selectedFiles.forEach((file, index) => {
+        // Vídeos: preview direto do arquivo, sem carregar tudo em memória como data URL
+        if (file.type.startsWith('video/')) {
+            const previewItem = document.createElement('div');
+            previewItem.className = 'preview-item';
+            previewItem.innerHTML = `
+                <video src="${URL.createObjectURL(file)}" muted></video>
+                <div class="file-name">🎬 ${file.name}</div>
+                <button class="remove-btn" onclick="removerArquivo(${index})">×</button>
+            `;
+            previewGrid.appendChild(previewItem);
+            return;
+        }
+        
         const reader = new FileReader();
         
         reader.onload = (e) => {
@@ -103,8 +116,16 @@ async function enviarImagens() {
         return;
     }
     
-    // Criar FormData
+    // Criar FormData: as opções vão antes dos arquivos, porque o servidor
+    // começa a processar cada imagem assim que ela termina de chegar
     const formData = new FormData();
+    
+    // Por padrão a análise é feita pelas regras locais; o Gemini só quando pedido
+    if (document.getElementById('resumoIA').checked) {
+        formData.append('resumo_ia', '1');
+    }
+    formData.append('modo_video', document.getElementById('modoVideo').value);
+    
     selectedFiles.forEach(file => {
         formData.append('files[]', file);
     });
@@ -129,11 +150,8 @@ async function enviarImagens() {
         
         const data = await response.json();
         
-        // Salvar resultados no sessionStorage
-        sessionStorage.setItem('resultados', JSON.stringify(data.resultados));
-        
-        // Redirecionar para página de resultados
-        window.location.href = '/resultado';
+        // Os resultados ficam no histórico do servidor; a página busca pelo lote
+        window.location.href = `/resultado?lote=${data.lote_id}`;
         
     } catch (error) {
         alert(`Erro: ${error.message}`);
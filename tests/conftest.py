@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos de scripts/ importam uns aos outros sem pacote (como ao rodar `python app.py`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+
+@pytest.fixture
+def bancoTemporario(tmp_path, monkeypatch):
+    """Histórico SQLite isolado por teste"""
+    import historico
+    monkeypatch.setattr(historico, 'DB_PATH', str(tmp_path / 'historico.db'))
+    return historico
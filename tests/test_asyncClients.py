@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+from aiohttp import web
+
+from asyncClients import ClienteDetector, ClientesAsync
+
+
+async def iniciarStub(tratador):
+    """Sobe um servidor stub do detector em localhost (porta livre) e retorna (runner, url)"""
+    aplicacao = web.Application()
+    aplicacao.router.add_post('/projeto/1', tratador)
+    runner = web.AppRunner(aplicacao)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    porta = runner.addresses[0][1]
+    return runner, f'http://127.0.0.1:{porta}'
+
+
+async def usarDetector(tratador, chamadas, **kwargs):
+    """Faz `chamadas` predicts simultâneos contra o stub; retorna (respostas, cliente)"""
+    runner, url = await iniciarStub(tratador)
+    detector = ClienteDetector('chave', 'projeto', 1, base_url=url, **kwargs)
+    await detector.abrir()
+    try:
+        respostas = await asyncio.gather(*(detector.predict(b'img') for _ in range(chamadas)))
+    finally:
+        await detector.fechar()
+        await runner.cleanup()
+    return respostas, detector
+
+
+def test_retry_em_503_respeita_o_retry_after():
+    recebidas = []
+
+    async def tratador(request):
+        recebidas.append(time.monotonic())
+        if len(recebidas) == 1:
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        return web.json_response({'predictions': []})
+
+    respostas, detector = asyncio.run(usarDetector(tratador, 1, backoff_base=0.01))
+
+    assert respostas == [{'predictions': []}]
+    assert (detector.chamadas, detector.retries, detector.falhas) == (2, 1, 0)
+    assert recebidas[1] - recebidas[0] >= 0.95
+
+
+def test_token_bucket_espaca_as_chamadas_depois_da_rajada():
+    recebidas = []
+
+    async def tratador(request):
+        recebidas.append(time.monotonic())
+        return web.json_response({'predictions': []})
+
+    # 600 RPM = 1 chamada a cada 0,1 s depois das 2 da rajada
+    asyncio.run(usarDetector(tratador, 6, rpm=600, rajada=2, concorrencia=6))
+
+    intervalos = [b - a for a, b in zip(recebidas, recebidas[1:])]
+    assert intervalos[0] < 0.05
+    assert all(i >= 0.08 for i in intervalos[2:])
+    assert 0.35 <= recebidas[-1] - recebidas[0] < 0.8
+
+
+def test_lote_de_20_imagens_leva_uma_ida_e_volta_com_a_configuracao_padrao(monkeypatch):
+    async def tratador(request):
+        await asyncio.sleep(0.5)
+        return web.json_response({'predictions': []})
+
+    # O stub roda num loop próprio, numa thread separada do loop dos clientes
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runner, url = asyncio.run_coroutine_threadsafe(iniciarStub(tratador), loop).result()
+
+    for variavel in ('DETECTOR_CONCURRENCY', 'DETECTOR_RPM', 'DETECTOR_BURST'):
+        monkeypatch.delenv(variavel, raising=False)
+    monkeypatch.setenv('API_KEY_ROBOFLOW', 'chave')
+    monkeypatch.setenv('ROBOFLOW_PROJECT', 'projeto')
+    monkeypatch.setenv('ROBOFLOW_VERSION', '1')
+    monkeypatch.setenv('ROBOFLOW_API_URL', url)
+    clientes = ClientesAsync.doAmbiente()
+
+    async def lote():
+        return await asyncio.gather(*(clientes.detector.predict(b'img') for _ in range(20)))
+
+    try:
+        inicio = time.monotonic()
+        respostas = clientes.executar(lote())
+        duracao = time.monotonic() - inicio
+    finally:
+        clientes.fechar()
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    assert len(respostas) == 20
+    # 20 chamadas de 0,5 s cabem na rajada e na concorrência padrão: uma ida e volta só
+    assert duracao < 0.9
@@ -0,0 +1,41 @@
+import pytest
+
+
+def resultado(nome, *classes):
+    return {'sucesso': True, 'imagem_original': nome, 'imagem_resultado': f'resultado_{nome}',
+            'total_objetos': len(classes), 'deteccoes': [{'classe': c, 'confianca': 0.9} for c in classes]}
+
+
+@pytest.fixture
+def historico(bancoTemporario, monkeypatch):
+    """Três lotes, um por dia (1, 2 e 3 de março)"""
+    dias = iter(['2024-03-01 10:00:00', '2024-03-02 10:00:00', '2024-03-03 10:00:00'])
+    monkeypatch.setattr(bancoTemporario, 'agora', lambda: next(dias))
+    bancoTemporario.salvarLote([resultado('a.jpg', 'Martelo'), resultado('b.jpg', 'Alicate')])
+    bancoTemporario.salvarLote([resultado('c.jpg', 'Martelo', 'Alicate'), resultado('d.jpg')])
+    bancoTemporario.salvarLote([resultado('e.jpg', 'Martelo')])
+    return bancoTemporario
+
+
+def todasAsPaginas(historico, **filtros):
+    nomes, cursor = [], None
+    while True:
+        pagina = historico.listarResultados(limite=1, cursor=cursor, **filtros)
+        nomes += [r['imagem_original'] for r in pagina['resultados']]
+        cursor = pagina['proximo_cursor']
+        if cursor is None:
+            return nomes
+
+
+def test_filtro_por_classe(historico):
+    assert todasAsPaginas(historico, classe='Martelo') == ['e.jpg', 'c.jpg', 'a.jpg']
+
+
+def test_filtro_por_data_vira_faixa_de_ids(historico):
+    assert todasAsPaginas(historico, desde='2024-03-02', ate='2024-03-02 23:59:59') == ['d.jpg', 'c.jpg']
+    assert todasAsPaginas(historico, desde='2024-03-02', classe='Alicate') == ['c.jpg']
+    assert todasAsPaginas(historico, desde='2024-04-01') == []
+
+
+def test_lote_na_ordem_de_envio(historico):
+    assert todasAsPaginas(historico, lote_id=2) == ['c.jpg', 'd.jpg']
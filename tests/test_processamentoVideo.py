@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+
+import processamentoVideo
+
+# Brilho do quadro de cada cena -> ferramenta que o detector "vê" nela
+CENAS = [(40, 'Martelo de Ferro'), (130, 'Chave de Fenda'), (220, 'Alicate de Ferro')]
+QUADROS_POR_CENA = 60
+
+
+@pytest.fixture
+def videoComCortes(tmp_path):
+    """Três cenas de 60 quadros (menos que VIDEO_MAX_INTERVALO), uma ferramenta em cada"""
+    caminho = str(tmp_path / 'cortes.avi')
+    gravador = cv2.VideoWriter(caminho, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+    for brilho, _ in CENAS:
+        for _ in range(QUADROS_POR_CENA):
+            gravador.write(np.full((120, 160, 3), brilho, np.uint8))
+    gravador.release()
+    return caminho
+
+
+@pytest.fixture(autouse=True)
+def detectorFalso(monkeypatch):
+    """Detector que devolve a ferramenta da cena, sempre na mesma posição"""
+    # O "JPEG" enviado ao detector é só o brilho médio do quadro
+    monkeypatch.setattr(processamentoVideo, 'codificarQuadroChave', lambda quadro: bytes([int(quadro.mean())]))
+    monkeypatch.setattr(processamentoVideo, 'salvarImagemResultado', lambda *args: 'resultado.jpg')
+
+    async def detectarBytes(imagem_bytes, clientes, indice_modelo=None):
+        brilho = imagem_bytes[0]
+        _, classe = min(CENAS, key=lambda cena: abs(cena[0] - brilho))
+        return {'time': 0.01, 'predictions': [
+            {'class': classe, 'confidence': 0.9, 'x': 80, 'y': 60, 'width': 40, 'height': 30}
+        ]}
+
+    monkeypatch.setattr(processamentoVideo, 'detectarBytes', detectarBytes)
+
+
+def classesDetectadas(resultado):
+    return sorted(d['classe'] for d in resultado['deteccoes'])
+
+
+def test_amostragem_por_cena_conta_objetos_vistos_em_um_unico_quadro_chave(videoComCortes):
+    resultado = processamentoVideo.processVideo(videoComCortes, modo='cena', indice_modelo=0)
+
+    assert resultado['sucesso']
+    assert resultado['metricas_video']['quadros_inferidos'] == len(CENAS)
+    assert classesDetectadas(resultado) == sorted(classe for _, classe in CENAS)
+
+
+def test_amostragem_fixa_confirma_objetos_em_varios_quadros_chave(videoComCortes, monkeypatch):
+    monkeypatch.setattr(processamentoVideo, 'VIDEO_MIN_HITS', 2)
+
+    resultado = processamentoVideo.processVideo(videoComCortes, modo='fixo', indice_modelo=0)
+
+    # Um quadro-chave a cada VIDEO_PASSO quadros: cada ferramenta aparece em vários deles
+    assert classesDetectadas(resultado) == sorted(classe for _, classe in CENAS)
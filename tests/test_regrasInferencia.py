@@ -0,0 +1,46 @@
+from regrasInferencia import analisarDeteccoes
+
+
+def deteccao(classe, confianca, x, y, width, height):
+    """Objeto no formato de extrairDeteccoes (centro + largura/altura, confiança 0-1)"""
+    return {'classe': classe, 'confianca': confianca, 'x': x, 'y': y, 'width': width, 'height': height}
+
+
+def test_cabo_e_haste_vizinhos_viram_chave_de_fenda():
+    # Exemplo 1 do prompt.md: cabo em cima, haste logo abaixo
+    analise = analisarDeteccoes([
+        deteccao('handle', 0.87, 100, 100, 40, 80),
+        deteccao('metal-shaft', 0.85, 100, 200, 10, 120),
+    ])
+
+    assert analise['conclusiva']
+    assert analise['dados_json']['inferencias'] == [{
+        'objeto_inferido': 'Chave de Fenda',
+        'componentes_detectados': ['cabo/empunhadura', 'haste metálica'],
+        'confianca_inferencia': 90.0,
+        'tipo': 'composicao_partes'
+    }]
+
+
+def test_ferramenta_completa_com_as_proprias_partes_nao_duplica_inferencia():
+    # Exemplo 2 do prompt.md, com o detector também marcando as partes dentro da chave
+    analise = analisarDeteccoes([
+        deteccao('screwdriver', 0.92, 100, 150, 50, 220),
+        deteccao('handle', 0.87, 100, 90, 40, 80),
+        deteccao('metal-shaft', 0.85, 100, 190, 10, 120),
+    ])
+
+    assert analise['conclusiva']
+    assert analise['dados_json']['inferencias'] == []
+    assert analise['dados_json']['resumo_classes']['Chave de Fenda'] == 1
+
+
+def test_partes_distantes_ficam_sem_par_e_vao_para_o_gemini():
+    analise = analisarDeteccoes([
+        deteccao('handle', 0.87, 100, 100, 40, 80),
+        deteccao('metal-shaft', 0.85, 600, 500, 10, 120),
+    ])
+
+    assert not analise['conclusiva']
+    assert analise['motivo'].startswith('componentes sem par')
+    assert analise['dados_json']['inferencias'] == []
@@ -0,0 +1,130 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import app as aplicacao
+import predictDetector
+from asyncClients import ClientesAsync
+from modelPool import ModelPool
+
+NOME_MALICIOSO = '<img src=x onerror=alert(1)>.exe'
+PNG = cv2.imencode('.png', np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+
+
+def corpoMultipart(boundary, partes):
+    """Monta o corpo multipart na ordem dada: (nome_do_campo, nome_do_arquivo ou None, bytes)"""
+    corpo = b''
+    for campo, arquivo, dados in partes:
+        disposicao = f'form-data; name="{campo}"' + (f'; filename="{arquivo}"' if arquivo else '')
+        corpo += f'--{boundary}\r\nContent-Disposition: {disposicao}\r\n\r\n'.encode() + dados + b'\r\n'
+    return corpo + f'--{boundary}--\r\n'.encode()
+
+
+def enviar(cliente, partes):
+    return cliente.post('/upload', data=corpoMultipart('limite', partes),
+                        content_type='multipart/form-data; boundary=limite')
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch, bancoTemporario):
+    (tmp_path / 'uploads').mkdir()
+    monkeypatch.setitem(aplicacao.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+
+    def despacharFalso(caminho, **kwargs):
+        # Sem detector: a imagem "processada" volta na hora, sem detecções
+        futuro = concurrent.futures.Future()
+        futuro.set_result({'sucesso': True, 'imagem_original': caminho, 'imagem_resultado': 'r.jpg',
+                           'mensagem_ia': '', 'total_objetos': 0, 'deteccoes': []})
+        futuro.tarefa = []
+        return futuro
+
+    monkeypatch.setattr(aplicacao, 'despacharImagem', despacharFalso)
+    return aplicacao.app.test_client()
+
+
+def test_nome_de_arquivo_recusado_volta_sanitizado(cliente):
+    resposta = enviar(cliente, [('files[]', NOME_MALICIOSO, b'MZ')])
+
+    assert resposta.status_code == 400
+    assert resposta.json['detalhes'][0]['arquivo'] == 'img_srcx_onerroralert1.exe'
+
+
+def test_historico_nao_guarda_o_nome_bruto(cliente):
+    resposta = enviar(cliente, [('files[]', 'foto.png', PNG), ('files[]', NOME_MALICIOSO, b'MZ')])
+    assert resposta.status_code == 200
+
+    historico = cliente.get(f"/api/resultados?lote_id={resposta.json['lote_id']}").json['resultados']
+    nomes = [r['imagem_original'] for r in resposta.json['resultados'] + historico]
+    assert not any('<' in nome for nome in nomes)
+
+
+def test_vaga_do_pool_so_e_reservada_com_arquivo_valido(cliente, monkeypatch):
+    # Pool sem vaga livre e sem fila: qualquer reserva seria recusada na hora
+    pool = ModelPool(object, tamanho=1, max_fila=0)
+    pool.reservar()
+    monkeypatch.setattr(aplicacao, 'getPool', lambda: pool)
+
+    resposta = enviar(cliente, [('files[]', 'planilha.exe', b'MZ')])
+    assert resposta.status_code == 400
+
+    resposta = enviar(cliente, [('files[]', 'foto.png', PNG)])
+    assert resposta.status_code == 429
+    assert resposta.json['motivo'] == 'fila_cheia'
+
+
+def test_nome_exibido_e_o_enviado_e_o_caminho_fica_a_parte(cliente):
+    resposta = enviar(cliente, [('files[]', 'foto.png', PNG)])
+    resultado = resposta.json['resultados'][0]
+
+    assert resultado['imagem_original'] == 'foto.png'
+    assert resultado['arquivo'].endswith('_foto.png')
+    assert os.path.exists(os.path.join(aplicacao.app.config['UPLOAD_FOLDER'], resultado['arquivo']))
+
+    salvo = cliente.get(f"/api/resultados?lote_id={resposta.json['lote_id']}").json['resultados'][0]
+    assert (salvo['imagem_original'], salvo['arquivo']) == (resultado['imagem_original'], resultado['arquivo'])
+
+
+@pytest.mark.parametrize('partes', [
+    # Campo depois dos arquivos
+    [('files[]', 'foto.png', PNG), ('resumo_ia', None, b'1')],
+    # Corpo truncado depois do primeiro arquivo
+    [('files[]', 'foto.png', PNG)],
+])
+def test_requisicao_recusada_no_meio_nao_deixa_arquivos(cliente, partes):
+    corpo = corpoMultipart('limite', partes)
+    if len(partes) == 1:
+        corpo = corpo.replace(b'--limite--', b'--limite\r\nContent-Disposition: form-data; name="files[]"; '
+                                              b'filename="outra.png"\r\n\r\n' + PNG[:10])
+    resposta = cliente.post('/upload', data=corpo, content_type='multipart/form-data; boundary=limite')
+
+    assert resposta.status_code == 400
+    assert os.listdir(aplicacao.app.config['UPLOAD_FOLDER']) == []
+
+
+def test_cancelar_espera_a_thread_antes_de_apagar(tmp_path, monkeypatch):
+    clientes = ClientesAsync.doAmbiente()
+    monkeypatch.setattr(predictDetector, 'clientes', clientes)
+    comecou, terminou = threading.Event(), threading.Event()
+
+    def lerDevagar(caminho):
+        comecou.set()
+        time.sleep(0.3)
+        terminou.set()
+        raise OSError('leitura interrompida')
+
+    monkeypatch.setattr(predictDetector, 'preProcessImageBytes', lerDevagar)
+    try:
+        despachadas = [(str(tmp_path / 'foto.png'), predictDetector.despacharImagem(str(tmp_path / 'foto.png')))]
+        assert comecou.wait(2)
+
+        predictDetector.cancelarImagens(despachadas)
+        # Só depois disso o /upload apaga os arquivos
+        assert terminou.is_set()
+        assert despachadas[0][1].cancelled()
+    finally:
+        clientes.fechar()